@@ -0,0 +1,153 @@
+"""
+Logging pipeline for the Telegram bot
+Records are put on a queue and written by a background thread, so a slow log
+driver never blocks the event loop. Each record carries the job context (job id,
+username, chat id, stage) of the task or worker thread that logged it, and
+high-volume per-post lines are sampled.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+CONTEXT_FIELDS = ('job_id', 'username', 'chat_id', 'stage')
+
+_log_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+
+
+def set_log_context(**fields) -> None:
+    """
+    Add fields to the log context of the current task. Tasks created afterwards and
+    work handed to threads with a copied context (asyncio.to_thread, lane.run) inherit it.
+    """
+    _log_context.set({**_log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current log context to the record (runs in the thread that logs)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in _log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through only 1 in `every` INFO/DEBUG records from each high-volume call site: records
+    logged with extra={'sample': True}, and everything from the given chatty loggers.
+    WARNING and above always pass. Passed records get a 'sampled' attribute so readers can
+    scale counts back up.
+    """
+
+    def __init__(self, every: int, loggers: Iterable[str] = ()):
+        super().__init__()
+        self.every = every
+        self.loggers = set(loggers)
+        self.counts: Dict[Tuple[str, int], int] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        if not (getattr(record, 'sample', False) or record.name in self.loggers):
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: if the writer falls behind, records are dropped and counted"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback here - args may not survive the trip to another thread
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the job context as top-level fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ('sampled',):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic 'time - logger - level - message' line, with the job context appended"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = ' '.join(f"{field}={getattr(record, field)}" for field in CONTEXT_FIELDS
+                           if getattr(record, field, None) is not None)
+        if getattr(record, 'sampled', None):
+            context += f" sampled=1/{record.sampled}"
+        return f"{line} [{context.strip()}]" if context.strip() else line
+
+
+def setup_logging() -> DroppingQueueHandler:
+    """
+    Route all logging through a bounded queue to a background writer on stderr.
+    LOG_FORMAT=json|text, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_EVERY and
+    LOG_SAMPLED_LOGGERS (comma-separated) tune it.
+    """
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter() if os.getenv('LOG_FORMAT', 'json').lower() == 'json' else TextFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', '10000'))))
+    handler.addFilter(SamplingFilter(int(os.getenv('LOG_SAMPLE_EVERY', '10')),
+                                     [name for name in os.getenv('LOG_SAMPLED_LOGGERS', 'httpx').split(',') if name]))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    listener = logging.handlers.QueueListener(handler.queue, writer)
+    listener.start()
+    atexit.register(listener.stop)  # Flushes whatever is still queued
+    return handler
@@ -32,12 +32,20 @@ def build_executable():
     subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
     
     # Build command
+    # One-file builds unpack everything to a temp folder on each run, so keep the
+    # bundle small (exclude modules the CLI never uses) and skip UPX, whose
+    # decompression adds to every startup.
     cmd = [
         "pyinstaller",
         "--onefile",
         "--name=insta-dl",
         "--console",
         "--clean",
+        "--noupx",
+        "--exclude-module=tkinter",
+        "--exclude-module=unittest",
+        "--exclude-module=pydoc",
+        "--exclude-module=telegram",
         "--distpath=.",
         "insta_cli.py"
     ]
@@ -68,6 +76,7 @@ def build_executable():
         print("\n🚀 Usage:")
         print("  insta-dl.exe username")
         print("  insta-dl.exe username -o my_folder")
+        print("  insta-dl.exe username --profile-startup  (show startup timings)")
         print("  RUN-EXE.bat  (interactive mode)")
         
         return True
@@ -4,11 +4,334 @@ Instagram Content Downloader CLI
 Downloads all posts and reels from public Instagram profiles
 """
 
-import instaloader
+from __future__ import annotations
+
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import argparse
+import json
+import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
+from post_filters import PostFilter, TYPE_CHOICES, parse_date
+from startup import StartupProfiler, instaloader
+
+MANIFEST_NAME = '.insta-dl-manifest.jsonl'
+
+startup_profiler = StartupProfiler(_STARTUP_T0)
+
+
+class RateLimiter:
+    """Thread-safe limiter shared by all workers: at most `rate` requests per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        """Block until the caller may issue its next request"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_for = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+class Manifest:
+    """
+    Append-only record of completed posts in the output folder.
+    One JSON line per post, so an interrupted run loses at most the posts in flight.
+    """
+
+    def __init__(self, folder: Path):
+        self.path = folder / MANIFEST_NAME
+        self.lock = threading.Lock()
+        self.done = set()
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)['shortcode'])
+                    except (ValueError, KeyError):
+                        continue  # Partially written last line
+
+    def __contains__(self, shortcode: str) -> bool:
+        return shortcode in self.done
+
+    def add(self, shortcode: str, nbytes: int):
+        with self.lock:
+            self.done.add(shortcode)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'shortcode': shortcode, 'bytes': nbytes, 'time': int(time.time())}) + '\n')
+
+
+class Progress:
+    """Counters for one profile, optionally rendered as one compact status line"""
+
+    def __init__(self, quiet: bool):
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.posts = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def add_bytes(self, nbytes: int):
+        with self.lock:
+            self.bytes += nbytes
+
+    def post_done(self, ok: bool):
+        with self.lock:
+            if ok:
+                self.posts += 1
+            else:
+                self.failed += 1
+        self.render()
+
+    def post_skipped(self):
+        with self.lock:
+            self.skipped += 1
+        self.render()
+
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started, 1e-6)
+
+    def render(self, final: bool = False):
+        if self.quiet:
+            return
+        elapsed = self.elapsed()
+        line = (f"⬇️  {self.posts} posts | {self.posts / elapsed:.2f} posts/s | "
+                f"{self.bytes / elapsed / (1024 * 1024):.2f} MB/s | "
+                f"{self.skipped} skipped | {self.failed} failed")
+        print('\r' + line.ljust(78), end='\n' if final else '', flush=True)
+
+    def summary(self) -> dict:
+        return {
+            'posts': self.posts,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'elapsed_s': round(self.elapsed(), 2),
+        }
+
+
+class Downloader:
+    """
+    Process-wide download state: one rate limiter, one pool of post workers and
+    one Instaloader (HTTP session) per thread, reused across every profile.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.limiter = RateLimiter(args.rate)
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=args.workers)
+        self.stopping = threading.Event()
+        self.post_filter = PostFilter(
+            media='images' if args.images_only else 'videos' if args.videos_only else None,
+            since=args.since, until=args.until, min_likes=args.min_likes, post_type=args.type
+        )
+
+    def loader(self) -> instaloader.Instaloader:
+        """
+        This thread's Instaloader. File writes are counted towards the progress of the
+        post currently handled by the thread; Instaloader's own per-file output is
+        silenced so it doesn't break the progress line.
+        """
+        if not hasattr(self.local, 'loader'):
+            loader = instaloader.Instaloader(
+                download_pictures=self.post_filter.download_pictures,
+                download_videos=self.post_filter.download_videos,
+                download_video_thumbnails=False,
+                download_geotags=False,
+                download_comments=False,
+                save_metadata=False,  # No JSON files
+                post_metadata_txt_pattern="",  # No .txt files
+                storyitem_metadata_txt_pattern="",  # No story .txt files
+                compress_json=False,
+                dirname_pattern=self.args.output + "/{profile}",
+                quiet=True
+            )
+            write_raw = loader.context.write_raw
+
+            def counting_write_raw(resp, filename):
+                write_raw(resp, filename)
+                nbytes = os.path.getsize(filename)
+                self.local.bytes_written += nbytes
+                self.local.progress.add_bytes(nbytes)
+
+            loader.context.write_raw = counting_write_raw
+            get_json = loader.context.get_json
+
+            def limited_get_json(*args, **kwargs):
+                # Profile lookups, pagination and per-post metadata share the rate limit too
+                self.limiter.acquire()
+                return get_json(*args, **kwargs)
+
+            loader.context.get_json = limited_get_json
+            self.local.loader = loader
+        return self.local.loader
+
+    def download_post(self, post, username: str, manifest: Manifest, progress: Progress):
+        """Download one post on a worker thread and record it in the manifest"""
+        if self.stopping.is_set():
+            return
+        loader = self.loader()
+        self.local.progress = progress
+        self.local.bytes_written = 0
+        # The post was listed on the paginating thread: bind it to this thread's session
+        # so sidecar and video metadata requests don't share that thread's requests.Session
+        post = instaloader.Post(loader.context, post._node, post._owner_profile)
+        try:
+            self.limiter.acquire()
+            loader.download_post(post, target=username)
+        except Exception as e:
+            if not self.args.quiet and not progress.quiet:
+                print(f"\n❌ Error downloading {post.shortcode}: {str(e)}")
+            progress.post_done(False)
+            return
+        manifest.add(post.shortcode, self.local.bytes_written)
+        progress.post_done(True)
+
+    def download_profile(self, username: str, progress: Progress, verbose: bool = True):
+        """
+        Download posts of one profile. Pagination runs on the calling thread and
+        posts are handed to the shared worker pool, a bounded number at a time.
+        """
+        args = self.args
+        profile = instaloader.Profile.from_username(self.loader().context, username)
+
+        if verbose:
+            print(f"👤 {profile.full_name}")
+            print(f"📊 {profile.mediacount} posts total")
+            if args.limit:
+                print(f"🎯 Downloading first {args.limit} posts")
+            if args.workers > 1:
+                print(f"🧵 Using {args.workers} workers")
+            if not self.post_filter.is_empty():
+                print(f"🔎 Filters: {self.post_filter.describe()}")
+            print()
+
+        profile_folder = Path(args.output) / username
+        profile_folder.mkdir(parents=True, exist_ok=True)
+        manifest = Manifest(profile_folder)
+
+        considered = 0
+        pending = set()
+        try:
+            for position, post in enumerate(profile.get_posts()):
+                if self.stopping.is_set() or (args.limit and considered >= args.limit):
+                    break
+                # Posts come newest-first: past the --since date nothing else can match
+                if self.post_filter.past_window(post, position):
+                    break
+                if not self.post_filter.matches(post):
+                    continue
+                considered += 1
+
+                if args.resume and post.shortcode in manifest:
+                    progress.post_skipped()
+                    continue
+
+                # Keep a bounded number of posts in flight so pagination stays just ahead
+                while len(pending) >= args.workers * 2:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(self.pool.submit(self.download_post, post, username, manifest, progress))
+            wait(pending)
+        finally:
+            for future in pending:
+                future.cancel()
+            progress.render(final=True)
+
+    def shutdown(self):
+        self.stopping.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def read_username_file(path: str) -> list:
+    """Usernames from a file: one per line, blank lines and # comments ignored"""
+    usernames = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            name = line.split('#', 1)[0].strip().lstrip('@')
+            if name and name not in usernames:
+                usernames.append(name)
+    return usernames
+
+
+def run_batch(downloader: Downloader, usernames: list, args) -> dict:
+    """
+    Download many profiles in one process, `args.parallel_profiles` at a time,
+    and return a summary entry per profile.
+    """
+    results = {}
+
+    def one_profile(username: str) -> dict:
+        progress = Progress(quiet=True)
+        entry = {'username': username, 'status': 'ok', 'error': None}
+        try:
+            downloader.download_profile(username, progress, verbose=False)
+        except instaloader.exceptions.ProfileNotExistsException:
+            entry.update(status='error', error='profile does not exist')
+        except instaloader.exceptions.PrivateProfileNotFollowedException:
+            entry.update(status='error', error='profile is private')
+        except Exception as e:
+            entry.update(status='error', error=str(e))
+        entry.update(progress.summary())
+        if not args.quiet:
+            icon = '✅' if entry['status'] == 'ok' else '❌'
+            detail = f"{entry['posts']} posts, {entry['bytes'] / (1024 * 1024):.1f} MB, {entry['failed']} failed"
+            if entry['error']:
+                detail = entry['error']
+            print(f"{icon} @{username}: {detail} ({entry['elapsed_s']}s)", flush=True)
+        return entry
+
+    with ThreadPoolExecutor(max_workers=args.parallel_profiles) as profile_pool:
+        futures = {profile_pool.submit(one_profile, name): name for name in usernames}
+        try:
+            for future in futures:
+                results[futures[future]] = future.result()
+        except KeyboardInterrupt:
+            downloader.shutdown()
+            profile_pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            for future, name in futures.items():
+                if name not in results:
+                    results[name] = {'username': name, 'status': 'interrupted', 'error': None,
+                                     'posts': 0, 'skipped': 0, 'failed': 0, 'bytes': 0, 'elapsed_s': 0}
+            write_summary(args.summary, usernames, results)
+    return results
+
+
+def write_summary(path: str, usernames: list, results: dict):
+    """Write the machine-readable batch summary (profiles in input order plus totals)"""
+    profiles = [results[name] for name in usernames if name in results]
+    summary = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'profiles': profiles,
+        'totals': {
+            'profiles': len(profiles),
+            'errors': sum(1 for p in profiles if p['status'] != 'ok'),
+            'posts': sum(p['posts'] for p in profiles),
+            'bytes': sum(p['bytes'] for p in profiles),
+            'failed': sum(p['failed'] for p in profiles),
+        },
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Instagram Content Downloader - Download posts and reels',
@@ -19,67 +342,101 @@ Examples:
   python insta_cli.py username -o my_folder       # Download to custom folder
   python insta_cli.py username --limit 50         # Download only first 50 posts
   python insta_cli.py username --quiet            # Minimal output
+  python insta_cli.py username --workers 4        # Download 4 posts at a time
+  python insta_cli.py username --resume           # Skip posts already downloaded
+  python insta_cli.py --batch users.txt           # Download every profile in users.txt
+  python insta_cli.py username --videos-only --since 2024-09-01
         '''
     )
-    
-    parser.add_argument('username', help='Instagram username (without @)')
-    parser.add_argument('-o', '--output', default='downloads', 
+
+    parser.add_argument('username', nargs='?', help='Instagram username (without @)')
+    parser.add_argument('-o', '--output', default='downloads',
                        help='Output folder (default: downloads)')
-    parser.add_argument('--limit', type=int, 
+    parser.add_argument('--limit', type=int,
                        help='Limit number of posts to download')
     parser.add_argument('--quiet', '-q', action='store_true',
                        help='Quiet mode - minimal output')
-    
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                       help='Number of posts to download in parallel (default: 1)')
+    parser.add_argument('--rate', type=float, default=2.0,
+                       help='Max Instagram requests per second across all workers (default: 2)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip posts recorded in the output folder manifest')
+    parser.add_argument('--batch', metavar='FILE',
+                       help='File with one username per line; all are downloaded in one run')
+    parser.add_argument('--parallel-profiles', type=int, default=2,
+                       help='Profiles processed at the same time in batch mode (default: 2)')
+    parser.add_argument('--summary', metavar='FILE',
+                       help='Batch JSON summary path (default: <output>/batch-summary.json)')
+    filters = parser.add_argument_group('filters (checked before anything is downloaded)')
+    media = filters.add_mutually_exclusive_group()
+    media.add_argument('--images-only', action='store_true', help='Download pictures only')
+    media.add_argument('--videos-only', action='store_true', help='Download videos only')
+    filters.add_argument('--since', type=parse_date, metavar='YYYY-MM-DD',
+                        help='Only posts from this date on (stops paging once older posts are reached)')
+    filters.add_argument('--until', type=parse_date, metavar='YYYY-MM-DD',
+                        help='Only posts up to and including this date')
+    filters.add_argument('--min-likes', type=int, metavar='N', help='Only posts with at least N likes')
+    filters.add_argument('--type', choices=TYPE_CHOICES, help='Only this kind of post')
+    parser.add_argument('--profile-startup', action='store_true',
+                       help='Print time spent in each startup phase')
+
+    startup_profiler.mark('module imports')
     args = parser.parse_args()
-    
+    startup_profiler.enabled = args.profile_startup
+    startup_profiler.mark('argument parsing')
+    args.workers = max(1, args.workers)
+    args.parallel_profiles = max(1, args.parallel_profiles)
+
+    if bool(args.username) == bool(args.batch):
+        parser.error('give either a username or --batch FILE')
+
     # Create output folder
     Path(args.output).mkdir(exist_ok=True)
-    
-    # Setup instaloader
-    loader = instaloader.Instaloader(
-        download_videos=True,
-        download_video_thumbnails=False,
-        download_geotags=False,
-        download_comments=False,
-        save_metadata=False,  # No JSON files
-        post_metadata_txt_pattern="",  # No .txt files
-        storyitem_metadata_txt_pattern="",  # No story .txt files
-        compress_json=False,
-        dirname_pattern=args.output + "/{profile}",
-        quiet=args.quiet
-    )
-    
+
+    instaloader.load()
+    startup_profiler.mark('import instaloader')
+    downloader = Downloader(args)
+    downloader.loader()
+    startup_profiler.mark('session setup')
+    # One-file builds unpack to a temp dir before any Python code runs
+    startup_profiler.report(lambda text: print(text, file=sys.stderr),
+                            ["(excludes one-file unpacking, which happens before Python starts)"]
+                            if getattr(sys, 'frozen', False) else [])
+
+    if args.batch:
+        try:
+            usernames = read_username_file(args.batch)
+        except OSError as e:
+            print(f"❌ Cannot read batch file: {e}")
+            sys.exit(1)
+        args.summary = args.summary or str(Path(args.output) / 'batch-summary.json')
+
+        if not args.quiet:
+            print(f"📥 Batch download of {len(usernames)} profiles "
+                  f"({args.parallel_profiles} at a time, {args.workers} workers)")
+        try:
+            results = run_batch(downloader, usernames, args)
+        except KeyboardInterrupt:
+            print(f"\n⏹️  Batch stopped by user. Partial summary written to {args.summary}")
+            sys.exit(0)
+        finally:
+            downloader.shutdown()
+
+        errors = sum(1 for r in results.values() if r['status'] != 'ok')
+        print(f"✅ Batch finished: {len(results) - errors} ok, {errors} failed. Summary: {args.summary}")
+        sys.exit(1 if errors == len(results) and results else 0)
+
+    progress = Progress(args.quiet)
+
     try:
         if not args.quiet:
             print(f"📥 Downloading content from @{args.username}")
-        
-        profile = instaloader.Profile.from_username(loader.context, args.username)
-        
-        if not args.quiet:
-            print(f"👤 {profile.full_name}")
-            print(f"📊 {profile.mediacount} posts total")
-            if args.limit:
-                print(f"🎯 Downloading first {args.limit} posts")
-            print()
-        
-        post_count = 0
-        for post in profile.get_posts():
-            if args.limit and post_count >= args.limit:
-                break
-                
-            try:
-                if not args.quiet:
-                    print(f"⬇️  Post {post_count + 1}: {post.shortcode}")
-                loader.download_post(post, target=args.username)
-                post_count += 1
-                
-            except Exception as e:
-                if not args.quiet:
-                    print(f"❌ Error downloading {post.shortcode}: {str(e)}")
-                continue
-        
-        print(f"✅ Downloaded {post_count} posts to {args.output}/{args.username}/")
-        
+
+        downloader.download_profile(args.username, progress, verbose=not args.quiet)
+
+        print(f"✅ Downloaded {progress.posts} posts to {args.output}/{args.username}/")
+
     except instaloader.exceptions.ProfileNotExistsException:
         print(f"❌ Profile @{args.username} does not exist!")
         sys.exit(1)
@@ -87,11 +444,13 @@ Examples:
         print(f"❌ Profile @{args.username} is private! You need to follow them first.")
         sys.exit(1)
     except KeyboardInterrupt:
-        print(f"\n⏹️  Download stopped by user. {post_count} posts downloaded.")
+        print("\n⏹️  Download stopped by user. Run again with --resume to continue.")
         sys.exit(0)
     except Exception as e:
         print(f"❌ Unexpected error: {str(e)}")
         sys.exit(1)
+    finally:
+        downloader.shutdown()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
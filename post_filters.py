@@ -0,0 +1,172 @@
+"""
+Post filters shared by the Telegram bot and the CLI
+Filters are evaluated on post metadata before anything is downloaded
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+MEDIA_CHOICES = ('images', 'videos')
+TYPE_CHOICES = ('image', 'video', 'carousel', 'reel')
+MAX_PINNED = 3  # Posts a profile can pin; they are listed first regardless of age
+PIN_FIELDS = ('timeline_pinned_user_ids', 'clips_tab_pinned_user_ids', 'pinned_for_users')
+
+
+def parse_date(text: str) -> datetime:
+    """Parse YYYY-MM-DD into a UTC datetime (raises ValueError)"""
+    return datetime.strptime(text, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+class PostFilter:
+    """
+    Which posts (and which media inside them) a download should fetch.
+    Posts arrive newest-first, so once a non-pinned post is older than `since`
+    the whole rest of the profile can be skipped. `since` and `until` are whole
+    UTC days, both inclusive.
+    """
+
+    def __init__(self, media: Optional[str] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, min_likes: Optional[int] = None,
+                 post_type: Optional[str] = None):
+        self.media = media
+        self.since = since
+        self.until = until
+        self.min_likes = min_likes
+        self.post_type = post_type
+
+    def is_empty(self) -> bool:
+        return not any((self.media, self.since, self.until, self.min_likes, self.post_type))
+
+    # ---- Loader settings: media filters map onto what instaloader fetches per post
+
+    @property
+    def download_pictures(self) -> bool:
+        return self.media != 'videos'
+
+    @property
+    def download_videos(self) -> bool:
+        return self.media != 'images'
+
+    # ---- Per-post checks (metadata only, no extra requests for feed posts)
+
+    def past_window(self, post, position: int) -> bool:
+        """
+        True once pagination has gone past `since` - nothing older can match.
+        `position` is the post's 0-based place in the listing: the first MAX_PINNED
+        posts may be pinned, and Instagram doesn't always mark them as such.
+        """
+        if self.since is None or position < MAX_PINNED or is_pinned(post):
+            return False
+        return _utc(post.date_utc) < self.since
+
+    def matches(self, post) -> bool:
+        date = _utc(post.date_utc)
+        if self.since and date < self.since:
+            return False
+        if self.until and date >= self.until + timedelta(days=1):
+            return False
+        if self.min_likes is not None and (post.likes or 0) < self.min_likes:
+            return False
+
+        if self.media == 'images' and post.typename == 'GraphVideo':
+            return False
+        if self.media == 'videos':
+            if post.typename == 'GraphImage':
+                return False
+            if post.typename == 'GraphSidecar' and not any(post.get_is_videos()):
+                return False
+
+        if self.post_type:
+            return _post_type(post) == self.post_type or (self.post_type == 'video' and _post_type(post) == 'reel')
+        return True
+
+    # ---- Parsing / display
+
+    @classmethod
+    def parse_tokens(cls, tokens: List[str]) -> Tuple['PostFilter', List[str]]:
+        """
+        Parse bot-style filter words: images, videos, since:YYYY-MM-DD,
+        until:YYYY-MM-DD, likes:N, type:image|video|carousel|reel.
+        Returns the filter and a list of error messages.
+        """
+        post_filter = cls()
+        errors = []
+        for token in tokens:
+            word = token.strip().lower()
+            key, _, value = word.partition(':')
+            try:
+                if word in MEDIA_CHOICES:
+                    post_filter.media = word
+                elif key == 'since' and value:
+                    post_filter.since = parse_date(value)
+                elif key == 'until' and value:
+                    post_filter.until = parse_date(value)
+                elif key in ('likes', 'minlikes') and value:
+                    post_filter.min_likes = int(value)
+                elif key == 'type' and value in TYPE_CHOICES:
+                    post_filter.post_type = value
+                else:
+                    errors.append(f"Unknown filter: {token}")
+            except ValueError:
+                errors.append(f"Invalid value in: {token}")
+        if post_filter.since and post_filter.until and post_filter.since > post_filter.until:
+            errors.append("since: must not be after until:")
+        return post_filter, errors
+
+    def describe(self) -> str:
+        """Short human readable summary, e.g. 'videos, since 2024-09-01, ≥1000 likes'"""
+        parts = []
+        if self.media:
+            parts.append(f"{self.media} only")
+        if self.post_type:
+            parts.append(f"type {self.post_type}")
+        if self.since:
+            parts.append(f"since {self.since:%Y-%m-%d}")
+        if self.until:
+            parts.append(f"until {self.until:%Y-%m-%d}")
+        if self.min_likes is not None:
+            parts.append(f"≥{self.min_likes} likes")
+        return ', '.join(parts) or 'none'
+
+    def to_dict(self) -> dict:
+        return {
+            'media': self.media,
+            'since': self.since.strftime('%Y-%m-%d') if self.since else None,
+            'until': self.until.strftime('%Y-%m-%d') if self.until else None,
+            'min_likes': self.min_likes,
+            'post_type': self.post_type,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> 'PostFilter':
+        data = data or {}
+        return cls(
+            media=data.get('media'),
+            since=parse_date(data['since']) if data.get('since') else None,
+            until=parse_date(data['until']) if data.get('until') else None,
+            min_likes=data.get('min_likes'),
+            post_type=data.get('post_type'),
+        )
+
+
+def is_pinned(post) -> bool:
+    """
+    True if the listing marks the post as pinned. instaloader's Post.is_pinned reads a
+    field Instagram no longer sends; logged-in listings keep the pin in the raw media.
+    """
+    node = getattr(post, '_node', None) or {}
+    return any(data.get(field) for data in (node, node.get('iphone_struct') or {}) for field in PIN_FIELDS)
+
+
+def _utc(date: datetime) -> datetime:
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def _post_type(post) -> str:
+    if post.typename == 'GraphSidecar':
+        return 'carousel'
+    if post.typename == 'GraphVideo':
+        # Reels are videos with product_type 'clips' in the post node
+        node = getattr(post, '_node', None) or {}
+        return 'reel' if node.get('product_type') == 'clips' else 'video'
+    return 'image'
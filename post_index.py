@@ -0,0 +1,214 @@
+"""
+Persistent per-profile index of post listings for the Telegram bot
+A profile's post nodes (shortcode, typename, timestamp, media URLs and
+dimensions, sidecar children) are kept on disk in listing order, so repeated
+or overlapping requests don't walk the profile's GraphQL pages again.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from post_filters import MAX_PINNED, is_pinned
+
+logger = logging.getLogger(__name__)
+
+URL_TTL_SECONDS = 6 * 3600  # Fallback lifetime of media URLs without an 'oe' expiry parameter
+URL_EXPIRY_MARGIN = 600     # Don't hand out URLs that expire within the next 10 minutes
+
+
+def _urls_fresh(entry: dict, now: float) -> bool:
+    """Instagram CDN URLs are signed and expire ('oe' = hex unix time); stale ones would 403"""
+    url = entry['node'].get('display_url') or ''
+    expires = parse_qs(urlparse(url).query).get('oe')
+    if expires:
+        try:
+            return int(expires[0], 16) - URL_EXPIRY_MARGIN > now
+        except ValueError:
+            pass
+    return entry['seen'] + URL_TTL_SECONDS > now
+
+
+class PostListingIndex:
+    """
+    One JSON file per profile under `directory`:
+    {"posts": [{"shortcode", "seen", "node"}, ...], "tail": frozen iterator or null, "complete": bool}
+    Posts are in Instagram's listing order (pinned first, then newest first). "tail" is the
+    frozen instaloader iterator just past the last stored post, so a longer request can
+    continue from there instead of paginating from the top.
+    """
+
+    def __init__(self, directory: Path, max_posts: int = 2000):
+        self.directory = directory
+        self.max_posts = max_posts
+        self.lock = threading.Lock()
+
+    def path(self, username: str) -> Path:
+        return self.directory / f"{username.lower()}.json"
+
+    def load(self, username: str) -> dict:
+        try:
+            with open(self.path(username), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Post index for {username} unreadable, starting fresh: {e}")
+        return {'posts': [], 'tail': None, 'complete': False}
+
+    def fresh_nodes(self, username: str) -> Dict[str, dict]:
+        """Stored nodes by shortcode, for posts whose media URLs are still usable"""
+        now = time.time()
+        return {entry['shortcode']: entry['node'] for entry in self.load(username)['posts']
+                if _urls_fresh(entry, now)}
+
+    def commit(self, username: str, posts: List[dict], tail: Optional[dict], complete: bool,
+               replace: bool = False) -> None:
+        """Store a listing, merging with whatever another job stored meanwhile (unless replace)"""
+        with self.lock:
+            current = self.load(username)
+            known = {entry['shortcode'] for entry in posts}
+            extra = [] if replace else [entry for entry in current['posts'] if entry['shortcode'] not in known]
+            if extra:
+                # The other listing reaches further - its end state applies
+                posts = posts + extra
+                tail, complete = current['tail'], current['complete']
+            if len(posts) > self.max_posts:
+                posts, tail, complete = posts[:self.max_posts], None, False
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path(username).with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'posts': posts, 'tail': tail, 'complete': complete}, f)
+            os.replace(tmp_path, self.path(username))
+
+
+class IndexedPosts:
+    """
+    Drop-in for profile.get_posts(): yields Post objects, using the index where it can.
+
+    1. head  - live listing until the first already-indexed (non-pinned) post; with few new
+               posts this is just the first page, which comes with the profile metadata
+    2. index - stored posts, as long as their media URLs are still valid
+    3. tail  - resume the stored frozen iterator past the end of the index
+    4. live  - keep walking the live listing (stale URLs, or no usable tail)
+    Call save() when done to write what was learnt back to the index.
+    """
+
+    def __init__(self, index: PostListingIndex, profile):
+        self.index = index
+        self.profile = profile
+        self.username = profile.username
+        stored = index.load(self.username)
+        self.stored: List[dict] = stored['posts']
+        self.stored_tail = stored['tail']
+        self.stored_complete = stored['complete']
+        self.position: Dict[str, int] = {entry['shortcode']: i for i, entry in enumerate(self.stored)}
+        self.phase = 'head'
+        self.cursor = 0
+        self.live = None
+        self.extension = None
+        self.yielded: Dict[str, dict] = {}  # shortcode -> index entry, in listing order
+        self.last_fetched = None  # (shortcode, iterator) of the last node fetched from Instagram
+        self.complete = False
+        self.from_index = 0
+        self.fetched = 0
+        self.charged_pages = 0  # Listing pages already charged to a request budget (ExecutionLane.charge_listing)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        import instaloader
+
+        while True:
+            if self.phase == 'head':
+                if self.live is None:
+                    self.live = self.profile.get_posts()
+                post = next(self.live, None)
+                if post is None:
+                    self.complete = True
+                    raise StopIteration
+                known = self.position.get(post.shortcode)
+                # An indexed post among the first few may be an old pinned one, not where new posts end
+                if known is not None and self.fetched >= MAX_PINNED and not is_pinned(post):
+                    self.phase = 'index'
+                    self.cursor = known + 1
+                return self._emit_fetched(post, self.live)
+
+            if self.phase == 'index':
+                if self.cursor < len(self.stored):
+                    entry = self.stored[self.cursor]
+                    self.cursor += 1
+                    if entry['shortcode'] in self.yielded:
+                        continue
+                    if not _urls_fresh(entry, time.time()):
+                        self.phase = 'live'
+                        continue
+                    self.yielded[entry['shortcode']] = entry
+                    self.from_index += 1
+                    return instaloader.Post(self.profile._context, entry['node'], self.profile)
+                if self.stored_complete:
+                    self.complete = True
+                    raise StopIteration
+                self.extension = self._thaw_tail()
+                self.phase = 'tail' if self.extension is not None else 'live'
+                continue
+
+            iterator = self.extension if self.phase == 'tail' else self.live
+            post = next(iterator, None)
+            if post is None:
+                self.complete = True
+                raise StopIteration
+            if post.shortcode in self.yielded:
+                continue
+            return self._emit_fetched(post, iterator)
+
+    def _emit_fetched(self, post, iterator):
+        self.yielded[post.shortcode] = {'shortcode': post.shortcode, 'seen': time.time(), 'node': post._node}
+        self.fetched += 1
+        self.last_fetched = (post.shortcode, iterator)
+        return post
+
+    def _thaw_tail(self):
+        import instaloader
+        from instaloader.nodeiterator import FrozenNodeIterator
+
+        if not self.stored_tail:
+            return None
+        try:
+            iterator = self.profile.get_posts()
+            iterator.thaw(FrozenNodeIterator(**self.stored_tail))
+            return iterator
+        except (instaloader.exceptions.InstaloaderException, TypeError) as e:
+            logger.info(f"Post index tail for {self.username} not resumable: {e}")
+            return None
+
+    def save(self) -> None:
+        """Write the merged listing (fresh nodes first, then the stored remainder) back to the index"""
+        if not self.yielded:
+            return
+        posts = list(self.yielded.values())
+        replace = False
+        if self.phase == 'head' and not self.complete and self.stored:
+            # Stopped among new posts before reaching the indexed ones - there may be a gap,
+            # so start a new listing that continues from here
+            replace = True
+            tail, complete = self.live.freeze()._asdict(), False
+        else:
+            posts += [entry for entry in self.stored if entry['shortcode'] not in self.yielded]
+            tail, complete = self.stored_tail, self.stored_complete
+            if self.complete and self.phase != 'index':
+                tail, complete = None, True
+            elif self.last_fetched and posts[-1]['shortcode'] == self.last_fetched[0]:
+                # The listing now reaches past the old end - remember where to resume
+                tail, complete = self.last_fetched[1].freeze()._asdict(), False
+        try:
+            self.index.commit(self.username, posts, tail, complete, replace)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save post index for {self.username}: {e}")
+        logger.info(f"Post listing for {self.username}: {self.from_index} from index, {self.fetched} fetched")
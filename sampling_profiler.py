@@ -0,0 +1,95 @@
+"""
+Low-overhead sampling profiler for the running bot
+A background thread snapshots the stack of every thread (event loop, lane
+workers, read-ahead threads, ...) at a fixed interval. The result is written in
+the collapsed-stack format used by flamegraph.pl and speedscope:
+"thread;outer (file:line);...;inner (file:line) count" per line.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# Leaf functions that mean "this thread is waiting, not working"
+IDLE_FUNCTIONS = {'select', 'poll', 'epoll', 'wait', '_worker', 'sleep', 'accept', 'readinto', 'recv_into'}
+
+
+class SamplingProfiler:
+    """Samples all threads' stacks every `interval` seconds between start() and stop()"""
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> None:
+        self.stacks.clear()
+        self.samples = 0
+        self.stop_event.clear()
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.duration = time.time() - self.started_at
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        names = {}
+        names_refreshed = 0.0
+        while not self.stop_event.wait(self.interval):
+            now = time.monotonic()
+            if now - names_refreshed > 1.0:
+                # Worker pools name threads "<prefix>_<n>" - merge them into one root per pool
+                names = {thread.ident: re.sub(r'_\d+$', '', thread.name) for thread in threading.enumerate()}
+                names_refreshed = now
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                self.stacks[(names.get(ident, f"thread-{ident}"),) + self._stack(frame)] += 1
+            self.samples += 1
+
+    def _stack(self, frame) -> Tuple[str, ...]:
+        functions = []
+        while frame is not None and len(functions) < self.max_depth:
+            code = frame.f_code
+            functions.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return tuple(reversed(functions))
+
+    # ---- Results
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one "frame;frame;... count" line each, busiest first"""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def hot_functions(self, limit: int = 8) -> List[Tuple[str, int]]:
+        """Functions most often on top of a non-idle stack (self time), by sample count"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if len(stack) > 1 and stack[-1].split(' ', 1)[0] not in IDLE_FUNCTIONS:
+                leaves[stack[-1]] += count
+        return leaves.most_common(limit)
+
+    def busy_share(self) -> float:
+        """Fraction of thread samples that were doing work rather than waiting"""
+        total = sum(self.stacks.values())
+        busy = sum(count for stack, count in self.stacks.items()
+                   if len(stack) > 1 and stack[-1].split(' ', 1)[0] not in IDLE_FUNCTIONS)
+        return busy / total if total else 0.0
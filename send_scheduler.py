@@ -0,0 +1,222 @@
+"""
+Central scheduler for everything the bot sends to Telegram
+Plugged into python-telegram-bot as its rate limiter, so every reply, edit,
+photo and video goes through one queue with global and per-chat limits.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class _Send:
+    __slots__ = ('callback', 'args', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, callback, args, kwargs, future: asyncio.Future):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class SendScheduler(BaseRateLimiter):
+    """
+    Fair, flood-limit aware send queue.
+
+    - Global limit: at most global_per_second requests start per second (Telegram allows ~30).
+    - Per chat: private chats get chat_per_second, groups group_per_minute (Telegram: 1/s, 20/min).
+    - Each chat has a FIFO queue with one request in flight, so messages arrive in order.
+    - Chats take turns (round robin), so one big download can't starve other users.
+    - RetryAfter puts the request back at the front of its chat's queue and pauses that chat
+      (or everything, for requests without a chat) instead of dropping the message.
+    Requests without a chat_id (callback answers, getMe, ...) skip the queue but still
+    respect a global RetryAfter pause.
+    """
+
+    def __init__(self, global_per_second: float = 25.0, chat_per_second: float = 1.0,
+                 group_per_minute: float = 20.0, max_retries: int = 5):
+        self.global_interval = 1.0 / global_per_second
+        self.chat_interval = 1.0 / chat_per_second
+        self.group_interval = 60.0 / group_per_minute
+        self.max_retries = max_retries
+
+        self.queues: Dict[Any, Deque[_Send]] = {}
+        self.turns: Deque[Any] = deque()  # Chats with queued sends, in round-robin order
+        self.busy: Set[Any] = set()  # Chats with a send in flight
+        self.chat_ready_at: Dict[Any, float] = {}
+        self.global_ready_at = 0.0
+        self.paused_until = 0.0  # Global RetryAfter
+        self.wakeup: Optional[asyncio.Event] = None
+        self.dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.sent = 0
+        self.retried = 0
+        self.max_queue_wait = 0.0
+
+    async def initialize(self) -> None:
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+            self.dispatcher = None
+        for queue in self.queues.values():
+            for item in queue:
+                if not item.future.done():
+                    item.future.cancel()
+        self.queues.clear()
+        self.turns.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None or self.dispatcher is None:
+            return await self._send_now(callback, args, kwargs)
+
+        item = _Send(callback, args, kwargs, asyncio.get_running_loop().create_future())
+        queue = self.queues.setdefault(chat_id, deque())
+        queue.append(item)
+        if chat_id not in self.turns:
+            self.turns.append(chat_id)
+        self.wakeup.set()
+        queued_at = time.monotonic()
+        result = await item.future
+        self.max_queue_wait = max(self.max_queue_wait, time.monotonic() - queued_at)
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            'queued': sum(len(queue) for queue in self.queues.values()),
+            'chats_waiting': len(self.turns),
+            'in_flight': len(self.busy),
+            'sent': self.sent,
+            'retried': self.retried,
+            'max_wait_s': round(self.max_queue_wait, 1),
+        }
+
+    # ---- Internals
+
+    async def _send_now(self, callback, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                self.paused_until = time.monotonic() + self._seconds(e.retry_after)
+
+    def _interval(self, chat_id) -> float:
+        is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+        return self.group_interval if is_group else self.chat_interval
+
+    @staticmethod
+    def _seconds(retry_after) -> float:
+        return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+    def _next_chat(self, now: float):
+        """First chat in turn order that may send now, else (None, earliest time one can)"""
+        earliest = None
+        for _ in range(len(self.turns)):
+            chat_id = self.turns[0]
+            self.turns.rotate(-1)
+            if chat_id in self.busy:
+                continue
+            ready_at = self.chat_ready_at.get(chat_id, 0.0)
+            if ready_at <= now:
+                # Move the chosen chat to the back: everyone else goes before its next send
+                self.turns.remove(chat_id)
+                return chat_id, now
+            earliest = ready_at if earliest is None else min(earliest, ready_at)
+        return None, earliest
+
+    async def _dispatch(self) -> None:
+        while True:
+            self.wakeup.clear()
+            now = time.monotonic()
+            start_at = max(self.global_ready_at, self.paused_until)
+            chat_id, ready_at = (None, None)
+            if self.turns and start_at <= now:
+                chat_id, ready_at = self._next_chat(now)
+            if chat_id is None:
+                timeout = None
+                if start_at > now:
+                    timeout = start_at - now
+                elif ready_at is not None:
+                    timeout = max(ready_at - now, 0.0)
+                # asyncio.wait, not wait_for: on Python 3.11 wait_for swallows a cancel that lands
+                # just as the event is set, and shutdown() would then wait forever
+                waiter = asyncio.ensure_future(self.wakeup.wait())
+                try:
+                    await asyncio.wait({waiter}, timeout=timeout)
+                finally:
+                    waiter.cancel()
+                continue
+
+            item = self.queues[chat_id].popleft()
+            if item.future.cancelled():
+                # The caller gave up (e.g. its job was cancelled) - drop it without using a send slot
+                self._finish(chat_id)
+                continue
+            self.busy.add(chat_id)
+            self.global_ready_at = now + self.global_interval
+            self.chat_ready_at[chat_id] = now + self._interval(chat_id)
+            asyncio.create_task(self._run(chat_id, item))
+
+    async def _run(self, chat_id, item: _Send) -> None:
+        try:
+            result = await item.callback(*item.args, **item.kwargs)
+        except RetryAfter as e:
+            item.attempts += 1
+            if item.attempts > self.max_retries or self.dispatcher is None:
+                # Out of retries, or shutdown() already cleared the queues - nothing would resend it
+                self._finish(chat_id)
+                if not item.future.done():
+                    item.future.set_exception(e)
+                return
+            self.retried += 1
+            retry_at = time.monotonic() + self._seconds(e.retry_after)
+            logger.warning(f"Telegram flood limit for chat {chat_id}, retrying in {self._seconds(e.retry_after):.0f}s")
+            self.chat_ready_at[chat_id] = max(self.chat_ready_at.get(chat_id, 0.0), retry_at)
+            self.queues.setdefault(chat_id, deque()).appendleft(item)  # Keep the chat's message order
+            self._finish(chat_id)
+            return
+        except BaseException as e:
+            self._finish(chat_id)
+            if not item.future.done():
+                item.future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        self.sent += 1
+        self._finish(chat_id)
+        if not item.future.done():
+            item.future.set_result(result)
+
+    def _finish(self, chat_id) -> None:
+        self.busy.discard(chat_id)
+        if self.queues.get(chat_id):
+            if chat_id not in self.turns:
+                self.turns.append(chat_id)
+        else:
+            # Idle chat: forget it, but keep its pacing until the interval has passed
+            self.queues.pop(chat_id, None)
+            if self.chat_ready_at.get(chat_id, 0.0) <= time.monotonic():
+                self.chat_ready_at.pop(chat_id, None)
+        self.wakeup.set()
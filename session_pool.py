@@ -0,0 +1,390 @@
+"""
+Pool of Instagram identities (optional login + optional proxy) for the Telegram bot
+Work is routed to the healthiest, least-loaded identity; identities that get
+throttled or keep failing are quarantined and retried later with backoff.
+A pool-wide circuit breaker stops all Instagram traffic during throttling incidents.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEALTH_WINDOW_SECONDS = 300      # Errors/429s older than this no longer count
+ERRORS_BEFORE_QUARANTINE = 3     # Consecutive failures that take an identity out of rotation
+QUARANTINE_BASE_SECONDS = 60     # First quarantine; doubles on each repeat offence
+QUARANTINE_MAX_SECONDS = 1800
+
+
+class PoolExhausted(Exception):
+    """Every identity in the pool is quarantined"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"All Instagram sessions are cooling down, retry in {int(retry_in)}s")
+        self.retry_in = retry_in
+
+
+class CircuitOpen(PoolExhausted):
+    """The pool-wide circuit breaker is rejecting Instagram requests"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(retry_in)
+        self.args = (f"Instagram requests paused after repeated failures, retry in {int(retry_in)}s",)
+
+
+class CircuitBreaker:
+    """
+    Pool-wide breaker for Instagram incidents (caller holds the pool lock).
+
+    closed    - requests flow; connection errors and 429s within `window` seconds are counted
+    open      - after `failures` of them: every request fails at once, for `cooldown` seconds
+                (doubling on each re-open, up to max_cooldown)
+    half-open - cooldown over: one probe request at a time; success closes, failure re-opens
+    """
+
+    def __init__(self, failures: int = 5, window: float = 60.0, cooldown: float = 60.0,
+                 max_cooldown: float = 900.0):
+        self.threshold = failures
+        self.window = window
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures: Deque[float] = deque()
+        self.opened = 0  # Consecutive openings, for the backoff
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.rejected = 0
+
+    def state(self, now: float) -> str:
+        if now < self.open_until:
+            return 'open'
+        return 'half-open' if self.opened else 'closed'
+
+    def retry_in(self, now: float) -> Optional[float]:
+        """Seconds until requests are accepted again, or None if they are accepted now"""
+        state = self.state(now)
+        if state == 'open':
+            return self.open_until - now
+        if state == 'half-open' and self.probe_in_flight:
+            return 5.0  # The probe decides shortly
+        return None
+
+    def allow(self, now: float) -> None:
+        """Admit one request or raise CircuitOpen; in half-open state the admitted one is the probe"""
+        retry_in = self.retry_in(now)
+        if retry_in is not None:
+            self.rejected += 1
+            raise CircuitOpen(retry_in)
+        if self.state(now) == 'half-open':
+            self.probe_in_flight = True
+
+    def record(self, now: float, failed: bool) -> None:
+        half_open = self.state(now) == 'half-open'
+        self.probe_in_flight = False
+        if not failed:
+            if half_open:
+                self.opened = 0
+                self.failures.clear()
+                logger.info("Circuit breaker closed - Instagram requests resumed")
+            return
+        self.failures.append(now)
+        while self.failures and self.failures[0] < now - self.window:
+            self.failures.popleft()
+        if half_open or (self.state(now) == 'closed' and len(self.failures) >= self.threshold):
+            self.opened += 1
+            cooldown = min(self.base_cooldown * 2 ** (self.opened - 1), self.max_cooldown)
+            self.open_until = now + cooldown
+            self.failures.clear()
+            logger.warning(f"Circuit breaker open for {cooldown:.0f}s - Instagram is failing or throttling")
+
+
+class PooledIdentity:
+    """One way out to Instagram: a (possibly logged-in) session and a (possibly direct) route"""
+
+    def __init__(self, name: str, username: Optional[str] = None, session_file: Optional[str] = None,
+                 password: Optional[str] = None, proxy: Optional[str] = None):
+        self.name = name
+        self.username = username
+        self.session_file = session_file
+        self.password = password
+        self.proxy = proxy
+        self.session_data: Optional[dict] = None  # Login cookies, shared by every loader on this identity
+
+        # Health
+        self.in_flight = 0
+        self.latency = 0.0  # Moving average, seconds
+        self.requests = 0
+        self.events: Deque[Tuple[float, str]] = deque()  # (time, 'error' | 'throttled')
+        self.consecutive_errors = 0
+        self.strikes = 0
+        self.quarantined_until = 0.0
+        self.probing = False  # Fresh out of quarantine - one request at a time until it succeeds
+
+    # ---- Health bookkeeping (caller holds the pool lock)
+
+    def _prune(self, now: float) -> None:
+        while self.events and self.events[0][0] < now - HEALTH_WINDOW_SECONDS:
+            self.events.popleft()
+
+    def recent(self, kind: str) -> int:
+        return sum(1 for _, event in self.events if event == kind)
+
+    def penalty(self, now: float) -> float:
+        """Extra load to charge for a poor recent record, in units of 'requests in flight'"""
+        self._prune(now)
+        return self.recent('error') + 3 * self.recent('throttled') + min(self.latency / 2.0, 5.0)
+
+    def is_quarantined(self, now: float) -> bool:
+        return now < self.quarantined_until
+
+    def quarantine(self, now: float, reason: str) -> None:
+        self.strikes += 1
+        duration = min(QUARANTINE_BASE_SECONDS * 2 ** (self.strikes - 1), QUARANTINE_MAX_SECONDS)
+        self.quarantined_until = now + duration
+        self.probing = True
+        self.consecutive_errors = 0
+        logger.warning(f"Session pool: '{self.name}' quarantined for {duration}s ({reason})")
+
+    def status(self, now: float) -> dict:
+        self._prune(now)
+        if self.is_quarantined(now):
+            state = f"quarantined {int(self.quarantined_until - now)}s"
+        elif self.probing:
+            state = 'probing'
+        else:
+            state = 'ok'
+        return {
+            'name': self.name,
+            'login': self.username or 'anonymous',
+            'proxy': bool(self.proxy),
+            'state': state,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.recent('error'),
+            'throttled': self.recent('throttled'),
+            'latency_ms': int(self.latency * 1000),
+        }
+
+    # ---- Loader setup
+
+    def login(self, loader) -> None:
+        """Load or create this identity's login session once; later loaders reuse the cookies"""
+        if self.session_file:
+            loader.load_session_from_file(self.username, self.session_file)
+        else:
+            if self.proxy:
+                loader.context._session.proxies = self.proxies()
+            loader.login(self.username, self.password)
+        self.session_data = loader.save_session()
+
+    def proxies(self) -> dict:
+        return {'http': self.proxy, 'https': self.proxy}
+
+
+class SessionPool:
+    """
+    Thread-safe router over PooledIdentity objects.
+
+    attach(loader) binds an instaloader.Instaloader to the best identity: it gets that
+    identity's cookies and proxy, and every request it makes feeds the identity's health.
+    """
+
+    def __init__(self, identities: List[PooledIdentity], breaker: Optional[CircuitBreaker] = None):
+        if not identities:
+            identities = [PooledIdentity('direct')]
+        self.identities = identities
+        self.breaker = breaker or CircuitBreaker()
+        self.lock = threading.Lock()
+        self.login_lock = threading.Lock()  # Logins are slow network calls - don't hold up routing
+
+    @classmethod
+    def from_config(cls, path: Optional[Path], breaker: Optional[CircuitBreaker] = None) -> 'SessionPool':
+        """
+        Build the pool from a JSON list such as
+        [{"name": "a", "username": "me", "session_file": "session-me", "proxy": "http://host:3128"},
+         {"name": "b", "proxy": "socks5://host:1080"}]
+        Passwords are read from the env var named by "password_env", never from the file.
+        """
+        if path is None or not path.exists():
+            return cls([], breaker)
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        identities = []
+        for i, entry in enumerate(entries):
+            password_env = entry.get('password_env')
+            identities.append(PooledIdentity(
+                name=entry.get('name') or f"session{i + 1}",
+                username=entry.get('username'),
+                session_file=entry.get('session_file'),
+                password=os.getenv(password_env) if password_env else None,
+                proxy=entry.get('proxy'),
+            ))
+        return cls(identities, breaker)
+
+    def __len__(self) -> int:
+        return len(self.identities)
+
+    # ---- Routing
+
+    def unavailable_for(self) -> Optional[float]:
+        """Seconds until Instagram work can start (breaker open or every identity quarantined), else None"""
+        now = time.time()
+        with self.lock:
+            retry_in = self.breaker.retry_in(now)
+            if retry_in is None and all(identity.is_quarantined(now) for identity in self.identities):
+                retry_in = min(identity.quarantined_until for identity in self.identities) - now
+        return retry_in
+
+    def pick(self) -> PooledIdentity:
+        """Least-loaded healthy identity (in-flight work plus a penalty for recent trouble)"""
+        now = time.time()
+        with self.lock:
+            retry_in = self.breaker.retry_in(now)
+            if retry_in is not None:
+                self.breaker.rejected += 1
+                raise CircuitOpen(retry_in)
+            candidates = [identity for identity in self.identities
+                          if not identity.is_quarantined(now)
+                          and not (identity.probing and identity.in_flight > 0)]
+            if not candidates:
+                retry_in = min(identity.quarantined_until for identity in self.identities) - now
+                raise PoolExhausted(max(retry_in, 1.0))
+            return min(candidates, key=lambda identity: identity.in_flight + identity.penalty(now))
+
+    @contextmanager
+    def lease(self, loader):
+        """attach() for the duration of a with-block"""
+        identity = self.attach(loader)
+        try:
+            yield identity
+        finally:
+            self.release(loader)
+
+    def attach(self, loader) -> PooledIdentity:
+        """
+        Route loader through an identity and report its requests to that identity's health.
+        The loader counts as in flight until release(loader).
+        """
+        identity = self.pick()
+        if identity.username and identity.session_data is None:
+            with self.login_lock:
+                if identity.session_data is None:
+                    identity.login(loader)
+        context = loader.context
+        if identity.session_data is not None:
+            context.load_session(identity.username, dict(identity.session_data))
+        if identity.proxy:
+            context._session.proxies = identity.proxies()
+            self._proxy_anonymous_sessions(context, identity)
+        self._instrument(context, identity)
+        with self.lock:
+            identity.in_flight += 1
+        loader.pool_identity = identity
+        return identity
+
+    def release(self, loader) -> None:
+        identity = getattr(loader, 'pool_identity', None)
+        if identity is None:
+            return
+        loader.pool_identity = None
+        with self.lock:
+            identity.in_flight -= 1
+
+    @staticmethod
+    def _proxy_anonymous_sessions(context, identity: PooledIdentity) -> None:
+        # Media and thumbnails are fetched via throwaway anonymous sessions, not context._session
+        anonymous_session = context.get_anonymous_session
+
+        @contextmanager
+        def proxied_anonymous_session():
+            with anonymous_session() as session:
+                session.proxies = identity.proxies()
+                yield session
+
+        context.get_anonymous_session = proxied_anonymous_session
+
+    # ---- Health reporting
+
+    def _instrument(self, context, identity: PooledIdentity) -> None:
+        import instaloader
+        import requests
+
+        failures = (instaloader.exceptions.InstaloaderException, requests.exceptions.RequestException)
+        harmless = (instaloader.exceptions.QueryReturnedNotFoundException,
+                    instaloader.exceptions.ProfileNotExistsException)
+
+        def timed(request):
+            def wrapper(*args, **kwargs):
+                with self.lock:
+                    self.breaker.allow(time.time())  # Fails fast while Instagram is throttling us
+                started = time.time()
+                try:
+                    result = request(*args, **kwargs)
+                except harmless:
+                    self.report(identity, time.time() - started)
+                    raise
+                except instaloader.exceptions.TooManyRequestsException:
+                    self.report(identity, time.time() - started, throttled=True)
+                    raise
+                except failures as e:
+                    # get_raw reports a 429 as a plain ConnectionException
+                    throttled = '429' in str(e)
+                    self.report(identity, time.time() - started, failed=not throttled, throttled=throttled)
+                    raise
+                except BaseException:
+                    # Neither success nor an Instagram failure (e.g. cancelled) - just free the probe slot
+                    with self.lock:
+                        self.breaker.probe_in_flight = False
+                    raise
+                self.report(identity, time.time() - started)
+                return result
+            return wrapper
+
+        context.get_json = timed(context.get_json)
+        context.get_raw = timed(context.get_raw)
+
+        # instaloader sleeps through 429s itself; take the identity out of rotation meanwhile
+        rate_controller = context._rate_controller
+        handle_429 = rate_controller.handle_429
+
+        def on_429(query_type: str) -> None:
+            self.report(identity, 0.0, throttled=True)
+            handle_429(query_type)
+
+        rate_controller.handle_429 = on_429
+
+    def report(self, identity: PooledIdentity, latency: float, failed: bool = False,
+               throttled: bool = False) -> None:
+        now = time.time()
+        with self.lock:
+            identity.requests += 1
+            self.breaker.record(now, failed or throttled)
+            if throttled:
+                identity.events.append((now, 'throttled'))
+                if not identity.is_quarantined(now):
+                    identity.quarantine(now, "HTTP 429")
+                return
+            identity.latency = latency if identity.requests == 1 else 0.8 * identity.latency + 0.2 * latency
+            if failed:
+                identity.events.append((now, 'error'))
+                identity.consecutive_errors += 1
+                if identity.probing or identity.consecutive_errors >= ERRORS_BEFORE_QUARANTINE:
+                    if not identity.is_quarantined(now):
+                        identity.quarantine(now, f"{identity.consecutive_errors or 1} errors")
+                return
+            identity.consecutive_errors = 0
+            if identity.probing:
+                identity.probing = False
+                identity.strikes = max(identity.strikes - 1, 0)
+                logger.info(f"Session pool: '{identity.name}' recovered")
+
+    def status(self) -> List[dict]:
+        now = time.time()
+        with self.lock:
+            return [identity.status(now) for identity in self.identities]
@@ -0,0 +1,66 @@
+"""
+Cold-start helpers shared by the bot and the CLI
+Heavy modules are imported on first use, and the wall time of each startup
+phase can be reported with --profile-startup.
+"""
+
+import time
+from typing import Callable, Iterable, List, Tuple
+
+
+class LazyModule:
+    """
+    Module proxy that performs the real import on first attribute access.
+    Keeps heavy dependencies off the cold-start path, so --help, argument errors
+    and the bot's first replies never wait for them.
+    """
+
+    def __init__(self, importer):
+        self._importer = importer
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = self._importer()
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+def _import_instaloader():
+    # Literal import statement so PyInstaller/static analysis still see the dependency
+    import instaloader as module
+    return module
+
+
+instaloader = LazyModule(_import_instaloader)
+
+
+class StartupProfiler:
+    """Wall time per startup phase, measured from `t0` (the process's first timestamp)"""
+
+    def __init__(self, t0: float, enabled: bool = False):
+        self.enabled = enabled
+        self.last = t0
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """Close the current phase under the given name"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, write: Callable[[str], None], notes: Iterable[str] = ()) -> None:
+        """Pass the phase table (plus any notes) to `write` as one text block, if enabled"""
+        if not self.enabled:
+            return
+        total = sum(duration for _, duration in self.phases)
+        lines = [f"  {phase:<28} {duration * 1000:8.1f} ms" for phase, duration in self.phases]
+        lines.append(f"  {'total':<28} {total * 1000:8.1f} ms")
+        lines += [f"  {note}" for note in notes]
+        write("⏱️ Startup profile:\n" + '\n'.join(lines))
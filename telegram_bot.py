@@ -4,40 +4,905 @@ Instagram Content Downloader Telegram Bot - Rewritten for Maximum Compatibility
 Handles all Instagram username formats including complex ones with underscores and periods
 """
 
+from __future__ import annotations
+
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import os
+import sys
 import asyncio
 import logging
 import tempfile
 import shutil
 import re
+import io
+import json
+import hashlib
+import multiprocessing
+import threading
+import uuid
+import signal
+import contextvars
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, List, Tuple
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import instaloader
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from typing import Any, Callable, Optional, List, Tuple, Dict, TYPE_CHECKING
+
+from bot_logging import set_log_context, setup_logging
+from post_filters import PostFilter
+from post_index import IndexedPosts, PostListingIndex
+from sampling_profiler import SamplingProfiler
+from session_pool import CircuitBreaker, PoolExhausted, SessionPool
+from startup import StartupProfiler, instaloader
+from watchlist import MAX_FAILURES, WatchedProfile, WatchList
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
+# Configure logging (queued, written by a background thread - see bot_logging)
+log_handler = setup_logging()
 logger = logging.getLogger(__name__)
 
+# Persistent bot state (hash index, job queue, quotas, ...) lives here
+DATA_DIR = Path(os.getenv('BOT_DATA_DIR', 'bot_data'))
+
+# ==================== PERSISTENCE HELPERS ====================
+
+def load_json_file(path: Path, default):
+    """Load a JSON state file, falling back to default if missing or corrupt"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read state file {path}: {e}")
+        return default
+
+def save_json_file(path: Path, data) -> None:
+    """Atomically write a JSON state file (write to temp file, then rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+# ==================== MEDIA DEDUPLICATION ====================
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file on disk, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class JobCancelled(Exception):
+    """Raised inside worker threads to abort a download whose job was cancelled"""
+
+def install_hashing_writer(loader: 'instaloader.Instaloader', file_hashes: Dict[str, str],
+                           cancel_event: Optional[threading.Event] = None) -> None:
+    """
+    Replace the loader's raw file writer with one that hashes media while it is written,
+    so deduplication never has to re-read files from disk. If cancel_event is set the
+    write is aborted between chunks and the partial file removed.
+    """
+    context = loader.context
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
+
+    def write_raw(resp, filename: str) -> None:
+        check_cancelled()
+        context.log(filename, end=' ', flush=True)
+        digest = hashlib.sha256()
+        try:
+            with open(filename + '.temp', 'wb') as file:
+                if isinstance(resp, bytes):
+                    digest.update(resp)
+                    file.write(resp)
+                else:
+                    for chunk in iter(lambda: resp.raw.read(1024 * 1024), b''):
+                        check_cancelled()
+                        digest.update(chunk)
+                        file.write(chunk)
+        except JobCancelled:
+            if os.path.exists(filename + '.temp'):
+                os.remove(filename + '.temp')
+            raise
+        os.replace(filename + '.temp', filename)
+        file_hashes[str(Path(filename))] = digest.hexdigest()
+
+    context.write_raw = write_raw
+
+class QuotaExceeded(Exception):
+    """A queued job reached its bulk slot after its user's daily quota ran out; carries the reply text"""
+
+class MediaTooLarge(Exception):
+    """A media file is over the upload limit; raised before its body is downloaded"""
+
+    def __init__(self, filename: str, size: int):
+        super().__init__(f"{filename}: {size} bytes")
+        self.filename = filename
+        self.size = size
+
+def install_size_guard(loader: 'instaloader.Instaloader', max_bytes: int,
+                       oversized: List[Tuple[str, int]]) -> None:
+    """
+    Skip media that could never be sent: media is fetched as a stream, so its
+    Content-Length is known before the body is read. Oversized files are closed
+    unread and recorded in oversized as (file name, size); the rest of the post
+    downloads normally.
+    """
+    context = loader.context
+    write_raw = context.write_raw
+    download_pic = loader.download_pic
+
+    def guarded_write_raw(resp, filename: str) -> None:
+        if not isinstance(resp, bytes):
+            size = int(resp.headers.get('Content-Length') or 0)
+            if size >= max_bytes:
+                resp.close()
+                raise MediaTooLarge(filename, size)
+        write_raw(resp, filename)
+
+    def guarded_download_pic(*args, **kwargs) -> bool:
+        try:
+            return download_pic(*args, **kwargs)
+        except MediaTooLarge as e:
+            logger.info(f"Skipping {os.path.basename(e.filename)} ({e.size / (1024 * 1024):.1f}MB) "
+                        f"before download - over the upload limit", extra={'sample': True})
+            oversized.append((os.path.basename(e.filename), e.size))
+            return False
+
+    context.write_raw = guarded_write_raw
+    loader.download_pic = guarded_download_pic
+
+class MediaHashIndex:
+    """
+    Persistent content-hash index of media already uploaded to Telegram.
+    Maps sha256 -> Telegram file_id so duplicates are re-sent by reference.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 50000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: Dict[str, dict] = load_json_file(path, {})
+        self.dirty = False
+
+    def get(self, digest: str, kind: str) -> Optional[str]:
+        """Return the cached Telegram file_id for this content, if any"""
+        entry = self.entries.get(digest)
+        if entry and entry.get('kind') == kind:
+            return entry.get('file_id')
+        return None
+
+    def record(self, digest: str, kind: str, file_id: str, size: int) -> None:
+        """Remember the file_id Telegram assigned to this content"""
+        self.entries.pop(digest, None)
+        self.entries[digest] = {'kind': kind, 'file_id': file_id, 'size': size, 'seen': int(time.time())}
+        # Evict oldest entries (dicts keep insertion order)
+        while len(self.entries) > self.max_entries:
+            self.entries.pop(next(iter(self.entries)))
+        self.dirty = True
+
+    def forget(self, digest: str) -> None:
+        """Drop an entry whose file_id Telegram no longer accepts"""
+        if self.entries.pop(digest, None) is not None:
+            self.dirty = True
+
+    def save(self) -> None:
+        """Persist the index if it changed (safe to call from a worker thread)"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            save_json_file(self.path, dict(self.entries))  # Snapshot - the loop may record meanwhile
+        except OSError as e:
+            self.dirty = True
+            logger.warning(f"Could not save media hash index: {e}")
+
+# ==================== USAGE ACCOUNTING ====================
+
+class UsageLedger:
+    """
+    Persistent per-user usage per UTC day: posts downloaded, bytes uploaded and
+    job seconds. Backs the daily quotas, /usage and the admin top list.
+    """
+
+    FIELDS = ('posts', 'bytes', 'seconds', 'jobs')
+
+    def __init__(self, path: Path, keep_days: int = 30):
+        self.path = path
+        self.keep_days = keep_days
+        self.users: Dict[str, dict] = load_json_file(path, {})  # user_id -> {'name', 'days': {date: totals}}
+        self.dirty = False
+
+    @staticmethod
+    def today() -> str:
+        return time.strftime('%Y-%m-%d', time.gmtime())
+
+    def record(self, user_id: int, name: Optional[str] = None, **amounts) -> None:
+        user = self.users.setdefault(str(user_id), {'name': None, 'days': {}})
+        if name:
+            user['name'] = name
+        day = user['days'].setdefault(self.today(), dict.fromkeys(self.FIELDS, 0))
+        for field, amount in amounts.items():
+            day[field] = day.get(field, 0) + amount
+        # Drop days past the retention window (dates sort lexically)
+        for old_day in sorted(user['days'])[:-self.keep_days]:
+            del user['days'][old_day]
+        self.dirty = True
+
+    def totals(self, user_id: int, days: int = 1) -> dict:
+        """Sums over the last `days` UTC days (1 = today)"""
+        user = self.users.get(str(user_id), {'days': {}})
+        since = time.strftime('%Y-%m-%d', time.gmtime(time.time() - (days - 1) * 86400))
+        result = dict.fromkeys(self.FIELDS, 0)
+        for day, values in user['days'].items():
+            if day >= since:
+                for field in self.FIELDS:
+                    result[field] += values.get(field, 0)
+        return result
+
+    def top(self, days: int = 1, limit: int = 10) -> List[Tuple[str, Optional[str], dict]]:
+        """Heaviest users by bytes uploaded: (user_id, name, totals)"""
+        rows = [(user_id, user.get('name'), self.totals(int(user_id), days)) for user_id, user in self.users.items()]
+        rows = [row for row in rows if row[2]['jobs']]
+        rows.sort(key=lambda row: (row[2]['bytes'], row[2]['posts']), reverse=True)
+        return rows[:limit]
+
+    def save(self) -> None:
+        """Persist if changed (safe to call from a worker thread)"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            save_json_file(self.path, json.loads(json.dumps(self.users)))  # Deep snapshot
+        except OSError as e:
+            self.dirty = True
+            logger.warning(f"Could not save usage ledger: {e}")
+
+# ==================== PROFILE SUMMARY CACHE ====================
+
+class ProfileSummaryCache:
+    """
+    Persistent cache of small profile summaries (name, counts, privacy, picture),
+    so inline queries can be answered without asking Instagram.
+    """
+
+    def __init__(self, path: Path, fresh_seconds: float, max_age_seconds: float, max_entries: int = 20000):
+        self.path = path
+        self.fresh_seconds = fresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self.entries: Dict[str, dict] = load_json_file(path, {})  # lowercase username -> summary
+        self.dirty = False
+
+    def get(self, username: str) -> Optional[dict]:
+        """Cached summary, unless it is too old to show at all"""
+        entry = self.entries.get(username.lower())
+        if entry and time.time() - entry['fetched'] < self.max_age_seconds:
+            return entry
+        return None
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry['fetched'] < self.fresh_seconds
+
+    def update(self, profile) -> dict:
+        """Store the summary of a freshly fetched instaloader Profile"""
+        key = profile.username.lower()
+        previous = self.entries.pop(key, {})
+        pic_id = self.pic_id(profile.profile_pic_url_no_iphone)
+        entry = {
+            'username': profile.username,
+            'full_name': profile.full_name,
+            'posts': profile.mediacount,
+            'followers': profile.followers,
+            'following': profile.followees,
+            'is_private': profile.is_private,
+            'is_verified': profile.is_verified,
+            # From the profile metadata - the HD variant would cost another request
+            'pic_url': profile.profile_pic_url_no_iphone,
+            # Keep the uploaded thumbnail as long as the picture is unchanged
+            'thumb_file_id': previous.get('thumb_file_id') if previous.get('pic_id') == pic_id else None,
+            'pic_id': pic_id,
+            'fetched': int(time.time()),
+        }
+        self.entries[key] = entry
+        # Evict oldest entries (dicts keep insertion order)
+        while len(self.entries) > self.max_entries:
+            self.entries.pop(next(iter(self.entries)))
+        self.dirty = True
+        return entry
+
+    def set_thumbnail(self, username: str, file_id: str) -> None:
+        entry = self.entries.get(username.lower())
+        if entry:
+            entry['thumb_file_id'] = file_id
+            self.dirty = True
+
+    @staticmethod
+    def pic_id(url: str) -> str:
+        """The picture's file name - the rest of a CDN URL changes whenever it is re-signed"""
+        return url.split('?')[0].rsplit('/', 1)[-1]
+
+    def save(self) -> None:
+        """Persist the cache if it changed (safe to call from a worker thread)"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            save_json_file(self.path, {key: dict(entry) for key, entry in list(self.entries.items())})
+        except OSError as e:
+            self.dirty = True
+            logger.warning(f"Could not save profile cache: {e}")
+
+# ==================== TEMP DIRECTORY REAPER ====================
+
+TEMP_DIR_PREFIX = 'instagram_'  # Every bot download/prefetch directory starts with this
+
+def bot_temp_root(token: str) -> Path:
+    """
+    This bot's own directory under the system temp dir. Keyed by the bot id (the part
+    of the token before ':'), so the reaper never sees other programs' directories or
+    those of another bot running on the same host.
+    """
+    return Path(tempfile.gettempdir()) / f"insta_telegram_bot_{token.split(':')[0]}"
+
+def make_temp_dir(root: Path, prefix: str) -> str:
+    """mkdtemp inside root, recreating root if a system tmp cleaner removed it"""
+    root.mkdir(parents=True, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+def scan_tree(path: Path) -> Tuple[int, float]:
+    """Total size and newest modification time of everything under path"""
+    size = 0
+    newest = path.stat().st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += st.st_size
+            newest = max(newest, st.st_mtime)
+    return size, newest
+
+def reap_temp_dirs(root: Path, active: set, max_age_seconds: float, budget_bytes: int) -> Tuple[int, int]:
+    """
+    Delete orphaned directories from the bot's temp root (left behind by a crash or OOM
+    kill): any untouched for max_age_seconds, then the oldest until the rest fit in
+    budget_bytes. Directories in `active` belong to running work and are skipped.
+    Returns (directories removed, bytes reclaimed).
+    """
+    if not root.is_dir():
+        return 0, 0
+    candidates = []
+    for path in root.glob(TEMP_DIR_PREFIX + '*'):
+        if str(path) in active or not path.is_dir():
+            continue
+        try:
+            size, newest = scan_tree(path)
+        except OSError:
+            continue
+        candidates.append((newest, str(path), size))
+    
+    candidates.sort()  # Oldest first
+    now = time.time()
+    total = sum(size for _, _, size in candidates)
+    removed = reclaimed = 0
+    for newest, path, size in candidates:
+        if now - newest < max_age_seconds and total <= budget_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+        reclaimed += size
+        total -= size
+    return removed, reclaimed
+
+def scan_media_dir(profile_dir: Path) -> Optional[List[Tuple[Path, int]]]:
+    """Files in a download directory with their sizes, or None if it doesn't exist"""
+    if not profile_dir.exists():
+        return None
+    return [(f, f.stat().st_size) for f in profile_dir.glob("*") if f.is_file()]
+
+# ==================== PREVIEW COLLAGES ====================
+
+def pick_thumbnail_url(post, min_width: int = 320) -> str:
+    """
+    Smallest thumbnail of a post that is at least min_width wide. For videos this is
+    the cover frame, so previews never fetch the video itself.
+    """
+    node = getattr(post, '_node', None) or {}
+    resources = sorted(node.get('thumbnail_resources') or [], key=lambda r: r.get('config_width', 0))
+    for resource in resources:
+        if resource.get('config_width', 0) >= min_width:
+            return resource['src']
+    if resources:
+        return resources[-1]['src']
+    return node.get('thumbnail_src') or post.url
+
+def build_collage(images: List[bytes], first_number: int, video_flags: List[bool],
+                  tile: int = 320, columns: int = 3) -> bytes:
+    """
+    Pack thumbnails into one numbered grid image (JPEG bytes).
+    Runs in a worker process, so it only takes and returns plain data.
+    """
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+    
+    rows = max(1, -(-len(images) // columns))
+    sheet = Image.new('RGB', (columns * tile, rows * tile), (24, 24, 24))
+    draw = ImageDraw.Draw(sheet)
+    try:
+        font = ImageFont.load_default(size=tile // 8)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size default font
+        font = ImageFont.load_default()
+    
+    for index, data in enumerate(images):
+        x, y = (index % columns) * tile, (index // columns) * tile
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                sheet.paste(ImageOps.fit(img.convert('RGB'), (tile, tile)), (x, y))
+        except Exception:
+            draw.rectangle([x, y, x + tile - 1, y + tile - 1], outline=(90, 90, 90))
+        
+        # Number badge in the corner, play triangle for videos
+        label = str(first_number + index)
+        box = draw.textbbox((0, 0), label, font=font)
+        badge_w, badge_h = box[2] - box[0] + 16, box[3] - box[1] + 12
+        draw.rectangle([x, y, x + badge_w, y + badge_h], fill=(0, 0, 0))
+        draw.text((x + 8 - box[0], y + 6 - box[1]), label, fill=(255, 255, 255), font=font)
+        if video_flags[index]:
+            cx, cy, r = x + tile - tile // 8, y + tile // 8, tile // 14
+            draw.polygon([(cx - r, cy - r), (cx - r, cy + r), (cx + r, cy)], fill=(255, 255, 255))
+    
+    out = io.BytesIO()
+    sheet.save(out, 'JPEG', quality=80)
+    return out.getvalue()
+
+# ==================== DOWNLOAD JOBS ====================
+
+class DownloadJob:
+    """A single download request: who asked, what for, how far it got and whether it was cancelled"""
+
+    def __init__(self, chat_id: int, user_id: Optional[int], username: str,
+                 download_all: bool = False, post_limit: Optional[int] = None,
+                 post_filter: Optional[PostFilter] = None, shortcodes: Optional[List[str]] = None):
+        self.job_id = uuid.uuid4().hex[:10]
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.username = username
+        self.download_all = download_all
+        self.post_limit = post_limit
+        self.post_filter = post_filter or PostFilter()
+        self.shortcodes = shortcodes  # Specific posts instead of paging through the profile
+        self.posts: Optional[list] = None  # Already-fetched Post objects for shortcodes (not persisted)
+        self.created_at = time.time()
+        self.cancel_event = threading.Event()  # Also visible to worker threads
+        self.task: Optional[asyncio.Task] = None
+        self.downloaded = 0
+        self.sent = 0
+        self.delivered_digests: set = set()  # Content already sent, skipped if the job is resumed
+        self.paused = False  # Stopped by shutdown, to be resumed on restart
+        self.resumed = False
+        self.started = False  # Holds a bulk lane slot (queued jobs are paused at once on shutdown)
+        self.started_at: Optional[float] = None
+        self.uploaded_bytes = 0
+        self.oversized: List[Tuple[str, int]] = []  # Media skipped before download: (file name, size)
+        self.user_name: Optional[str] = None  # For the admin usage view
+        self.runner: Optional[asyncio.Task] = None  # Handler task that reports the outcome
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self, pause: bool = False) -> None:
+        """
+        Stop the job: worker threads abort their next write, the job task is cancelled.
+        pause=True marks it for resumption after a restart instead of discarding it.
+        """
+        self.paused = pause
+        self.cancel_event.set()
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'chat_id': self.chat_id,
+            'user_id': self.user_id,
+            'username': self.username,
+            'download_all': self.download_all,
+            'post_limit': self.post_limit,
+            'post_filter': self.post_filter.to_dict(),
+            'shortcodes': self.shortcodes,
+            'created_at': self.created_at,
+            'downloaded': self.downloaded,
+            'sent': self.sent,
+            'delivered_digests': sorted(self.delivered_digests),
+            'started': self.started,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DownloadJob':
+        job = cls(data['chat_id'], data.get('user_id'), data['username'],
+                  data.get('download_all', False), data.get('post_limit'),
+                  PostFilter.from_dict(data.get('post_filter')), data.get('shortcodes'))
+        job.job_id = data.get('job_id', job.job_id)
+        job.created_at = data.get('created_at', job.created_at)
+        job.sent = data.get('sent', 0)
+        job.delivered_digests = set(data.get('delivered_digests', []))
+        # Only a job that had its bulk slot is a resumption; one that was still queued starts over
+        job.resumed = bool(data.get('started'))
+        return job
+
+class BrowseSession:
+    """A chat's live position in a profile's post listing, kept between "Next" taps"""
+
+    def __init__(self, chat_id: int, user_id: Optional[int], username: str, posts,
+                 post_filter: PostFilter, ttl_seconds: float):
+        self.session_id = uuid.uuid4().hex[:10]
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.username = username
+        self.posts = posts  # IndexedPosts listing - pages are fetched only on demand
+        self.post_filter = post_filter
+        self.ttl_seconds = ttl_seconds
+        self.lock = asyncio.Lock()  # One page at a time, even if "Next" is tapped twice
+        self.pages = 0
+        self.delivered = 0
+        self.scanned = 0  # Posts taken from the listing so far, across pages
+        self.exhausted = False
+        self.expires = 0.0
+        self.touch()
+
+    def touch(self) -> None:
+        self.expires = time.time() + self.ttl_seconds
+
+    @property
+    def expired(self) -> bool:
+        return time.time() > self.expires
+
+class StagedPrefetch:
+    """Media fetched speculatively after /info, waiting for the /download that usually follows"""
+
+    def __init__(self, chat_id: int, username: str, ttl_seconds: float):
+        self.chat_id = chat_id
+        self.username = username
+        self.temp_dir: Optional[str] = None  # Created by the prefetch task
+        self.files: Dict[str, List[str]] = {}  # shortcode -> downloaded file paths
+        self.file_hashes: Dict[str, str] = {}
+        self.oversized: Dict[str, List[Tuple[str, int]]] = {}  # shortcode -> media skipped as too large
+        self.bytes = 0
+        self.expires = time.time() + ttl_seconds
+        self.cancel_event = threading.Event()  # Set when real jobs need the lane
+        self.task: Optional[asyncio.Task] = None
+
+    def move_post(self, shortcode: str, dest_dir: str, file_hashes: Dict[str, str]) -> None:
+        """Hand one post's files (and their hashes) over to a job's download directory"""
+        os.makedirs(dest_dir, exist_ok=True)
+        for path in self.files.pop(shortcode):
+            target = str(Path(dest_dir) / Path(path).name)
+            os.replace(path, target)
+            if path in self.file_hashes:
+                file_hashes[str(Path(target))] = self.file_hashes.pop(path)
+
+# ==================== EXECUTION LANES ====================
+
+class RequestBudget:
+    """Async pacing of Instagram requests: at most `per_minute` calls, evenly spaced"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.next_slot = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        wait_for = self.next_slot - now
+        self.next_slot = max(now, self.next_slot) + self.interval
+        if wait_for > 0:
+            await asyncio.sleep(wait_for)
+
+async def run_tracked(future: asyncio.Future, in_flight: set):
+    """
+    Await a worker-thread future without cancelling it: a thread can't be interrupted, so if
+    the caller is cancelled the call keeps running and stays in `in_flight` until it returns.
+    """
+    in_flight.add(future)
+    future.add_done_callback(in_flight.discard)
+    return await asyncio.shield(future)
+
+async def settle(in_flight: set) -> None:
+    """Wait out worker calls left running by a cancelled caller (see run_tracked)"""
+    if in_flight:
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+class ExecutionLane:
+    """
+    A pool of job slots with its own worker threads (for blocking instaloader calls),
+    its own Instagram request budget and queue metrics.
+    """
+
+    def __init__(self, name: str, concurrency: int, requests_per_minute: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"{name}-lane")
+        self.budget = RequestBudget(requests_per_minute)
+        self.requests_per_minute = requests_per_minute
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the lane's job slots, waiting in line if all are busy"""
+        self.queued += 1
+        queued_at = time.monotonic()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+        waited = time.monotonic() - queued_at
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.running += 1
+        try:
+            yield
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+    def is_busy(self) -> bool:
+        """True if a new job would have to wait for a slot"""
+        return self.running + self.queued >= self.concurrency
+
+    async def run(self, func, *args, budget: bool = True, track: Optional[set] = None):
+        """
+        Run a blocking call on the lane's threads, spending one Instagram request unless budget=False.
+        With track, the call is added to that set until it returns (run_tracked) - for callers that
+        must not clean up what the call is using while it still runs.
+        """
+        if budget:
+            await self.budget.acquire()
+        # Copy the context so log lines from the worker thread keep the job's log context
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        future = asyncio.get_running_loop().run_in_executor(self.executor, call)
+        if track is not None:
+            return await run_tracked(future, track)
+        return await future
+
+    async def charge_listing(self, posts, page_size: int = 12) -> None:
+        """
+        Spend one Instagram request if the next next(posts) call may fetch a new listing page.
+        IndexedPosts counts posts fetched live; each full page of them means the next call
+        crosses a page. Posts served from the index cost nothing.
+        """
+        pages = getattr(posts, 'fetched', 0) // page_size
+        if pages > getattr(posts, 'charged_pages', 0):
+            posts.charged_pages = pages
+            await self.budget.acquire()
+
+    async def next_post(self, posts):
+        """The next post of a listing (None when exhausted), with its page fetches charged to the budget"""
+        await self.charge_listing(posts)
+        return await self.run(next, posts, None, budget=False)
+
+    def metrics(self) -> dict:
+        finished = max(self.completed + self.failed, 1)
+        return {
+            'lane': self.name,
+            'slots': self.concurrency,
+            'running': self.running,
+            'queued': self.queued,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_wait_s': round(self.total_wait / finished, 2),
+            'max_wait_s': round(self.max_wait, 2),
+            'requests_per_minute': self.requests_per_minute,
+        }
+
+class ReadAhead:
+    """
+    Pulls items from a blocking post iterator in a background task, up to `depth_pages`
+    pages ahead of the consumer, so GraphQL page fetches overlap with media downloads.
+    Each page fetched from Instagram is charged to the lane's request budget.
+    depth_pages=0 reads on demand, like calling next() directly.
+    Reading ahead stops after `limit` items (the most the consumer expects to need) or once
+    `stop(item, position)` is true, so it never fetches a page nobody will look at; items
+    asked for after that are read on demand.
+    """
+
+    def __init__(self, iterator, lane: ExecutionLane, executor: ThreadPoolExecutor,
+                 depth_pages: int, page_size: int = 12, limit: Optional[int] = None,
+                 stop: Optional[Callable[[Any, int], bool]] = None):
+        self.iterator = iterator
+        self.lane = lane
+        self.executor = executor
+        self.page_size = page_size
+        self.limit = limit
+        self.stop = stop
+        self.pulled = 0
+        self.pending = None  # concurrent.futures.Future of the next() call in flight
+        self.queue: Optional[asyncio.Queue] = asyncio.Queue(maxsize=depth_pages * page_size) if depth_pages > 0 else None
+        self.task = asyncio.create_task(self._fill()) if self.queue is not None else None
+
+    async def _pull(self):
+        await self.lane.charge_listing(self.iterator, self.page_size)
+        call = functools.partial(contextvars.copy_context().run, next, self.iterator, None)
+        self.pending = self.executor.submit(call)
+        item = await asyncio.wrap_future(self.pending)
+        self.pulled += 1
+        return item
+
+    async def _fill(self):
+        try:
+            while self.limit is None or self.pulled < self.limit:
+                item = await self._pull()
+                await self.queue.put(item)  # Waits once the look-ahead depth is reached
+                if item is None or (self.stop is not None and self.stop(item, self.pulled - 1)):
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.queue.put(e)  # Raised to the consumer at the same point next() would have
+
+    async def next(self):
+        """The next post, or None when the listing is exhausted"""
+        if self.queue is None or (self.queue.empty() and self.task.done()):
+            return await self._pull()
+        item = await self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def close(self) -> None:
+        """Stop reading ahead and wait out a fetch in flight, so the iterator can be used (saved) again"""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.pending is not None and not self.pending.done():
+            await asyncio.gather(asyncio.wrap_future(self.pending), return_exceptions=True)
+
 class RobustInstagramBot:
     """
     A robust Instagram downloader bot that handles all username formats
     """
     
-    def __init__(self, token: str):
+    def __init__(self, token: str, startup_profiler: Optional[StartupProfiler] = None):
+        from telegram.ext import Application
+        from send_scheduler import SendScheduler
+        
         self.token = token
-        self.app = Application.builder().token(token).build()
+        self.startup_profiler = startup_profiler or StartupProfiler(_STARTUP_T0)
+        # Every outgoing request goes through one scheduler that keeps within Telegram's flood limits
+        self.send_scheduler = SendScheduler(
+            global_per_second=float(os.getenv('TELEGRAM_SENDS_PER_SEC', '25')),
+            chat_per_second=float(os.getenv('TELEGRAM_CHAT_SENDS_PER_SEC', '1')),
+            group_per_minute=float(os.getenv('TELEGRAM_GROUP_SENDS_PER_MIN', '20')),
+        )
+        # Optional self-hosted Bot API server (telegram-bot-api --local): uploads by file path, up to 2GB
+        self.api_url = os.getenv('TELEGRAM_API_URL', '').rstrip('/')
+        self.local_mode = bool(self.api_url) and os.getenv('TELEGRAM_LOCAL_MODE', 'true').lower() in ('1', 'true', 'yes')
+        # Handlers must run concurrently, otherwise one download blocks every other chat
+        builder = (Application.builder().token(token).post_init(self.post_init)
+                   .rate_limiter(self.send_scheduler).concurrent_updates(True))
+        if self.api_url:
+            builder = (builder.base_url(f"{self.api_url}/bot").base_file_url(f"{self.api_url}/file/bot")
+                       .local_mode(self.local_mode))
+        self.app = builder.build()
         self.max_posts_per_request = 25
         self.max_file_size_mb = 1024  # 1GB internal processing limit
-        self.telegram_upload_limit_mb = 50  # Telegram's actual upload limit
+        self.telegram_upload_limit_mb = 2000 if self.local_mode else 50  # Bot API upload limit
+        self.filter_scan_factor = 10  # With filters, inspect at most this many posts per requested post
+        self.media_index = MediaHashIndex(DATA_DIR / 'media_hashes.json')
+        # Per-user accounting and daily quotas (0 = unlimited); admins are exempt
+        self.usage = UsageLedger(DATA_DIR / 'usage.json')
+        self.quota_posts_per_day = int(os.getenv('QUOTA_POSTS_PER_DAY', '500'))
+        self.quota_mb_per_day = float(os.getenv('QUOTA_MB_PER_DAY', '2048'))
+        self.quota_job_minutes_per_day = float(os.getenv('QUOTA_JOB_MINUTES_PER_DAY', '120'))
+        self.max_jobs_per_user = int(os.getenv('MAX_JOBS_PER_USER', '2'))  # Queued + running
+        self.admin_ids = {int(x) for x in os.getenv('ADMIN_USER_IDS', '').replace(' ', '').split(',') if x}
+        # Inline mode (@bot username): answered from cached profile summaries
+        self.profile_cache = ProfileSummaryCache(
+            DATA_DIR / 'profile_cache.json',
+            fresh_seconds=float(os.getenv('PROFILE_CACHE_FRESH_HOURS', '6')) * 3600,
+            max_age_seconds=float(os.getenv('PROFILE_CACHE_MAX_AGE_DAYS', '7')) * 86400,
+        )
+        self.inline_debounce_seconds = float(os.getenv('INLINE_DEBOUNCE_SECONDS', '0.7'))
+        self.inline_answer_deadline = 8.0  # Telegram stops accepting an answer a few seconds later
+        self.inline_thumb_chat_id = os.getenv('INLINE_THUMB_CHAT_ID')  # Where profile pictures are uploaded once
+        self.inline_latest: Dict[int, str] = {}  # user_id -> id of their most recent inline query
+        self.profile_lookups: Dict[str, asyncio.Task] = {}  # One Instagram lookup per username at a time
+        # /watch: profiles polled on adaptive schedules within a fixed Instagram request budget
+        self.watch_requests_per_hour = float(os.getenv('WATCH_REQUESTS_PER_HOUR', '120'))
+        self.watchlist = WatchList(DATA_DIR / 'watches.json', self.watch_requests_per_hour,
+                                   min_interval=float(os.getenv('WATCH_MIN_INTERVAL_MINUTES', '20')) * 60,
+                                   max_interval=float(os.getenv('WATCH_MAX_INTERVAL_HOURS', '24')) * 3600)
+        # Checks run one at a time on their own thread and budget, so they never take fast-lane
+        # slots or requests from /info and other interactive commands
+        self.watch_lane = ExecutionLane('watch', 1, self.watch_requests_per_hour / 60)
+        self.watch_max_per_chat = int(os.getenv('WATCH_MAX_PER_CHAT', '10'))
+        self.watch_wakeup: Optional[asyncio.Event] = None  # Set when a new profile needs its first check
+        # Post listings already walked, so repeated requests for a profile skip pagination
+        self.post_index = PostListingIndex(DATA_DIR / 'post_index', int(os.getenv('POST_INDEX_MAX_POSTS', '2000')))
+        # Instagram sessions/proxies that requests are spread over (one anonymous direct session by default)
+        # The circuit breaker stops all Instagram traffic for a while when errors/429s pile up
+        breaker = CircuitBreaker(failures=int(os.getenv('INSTAGRAM_BREAKER_FAILURES', '5')),
+                                 window=float(os.getenv('INSTAGRAM_BREAKER_WINDOW_SECONDS', '60')),
+                                 cooldown=float(os.getenv('INSTAGRAM_BREAKER_COOLDOWN_SECONDS', '60')))
+        self.session_pool = SessionPool.from_config(Path(os.getenv('INSTAGRAM_POOL_FILE',
+                                                                   str(DATA_DIR / 'sessions.json'))), breaker)
+        # Fast lane: /info and profile checks. Bulk lane: downloads and uploads.
+        # Separate slots and request budgets so cheap commands never queue behind downloads.
+        # Request budgets are per pool session, so throughput grows with the pool.
+        self.fast_lane = ExecutionLane('fast', int(os.getenv('FAST_LANE_WORKERS', '4')),
+                                       float(os.getenv('FAST_LANE_REQUESTS_PER_MIN', '30')) * len(self.session_pool))
+        self.bulk_lane = ExecutionLane('bulk', int(os.getenv('BULK_LANE_WORKERS', '2')),
+                                       float(os.getenv('BULK_LANE_REQUESTS_PER_MIN', '60')) * len(self.session_pool))
+        # Bulk downloads read the post listing ahead on their own threads (one per bulk slot)
+        self.readahead_pages = int(os.getenv('READAHEAD_PAGES', '1'))
+        self.readahead_executor = ThreadPoolExecutor(max_workers=self.bulk_lane.concurrency,
+                                                     thread_name_prefix='readahead')
+        self.jobs: Dict[str, DownloadJob] = {}  # Active (queued or running) jobs by job_id
+        # Jobs are persisted on every change so a restart (or crash) can resume them
+        self.jobs_file = DATA_DIR / 'jobs.json'
+        self.shutting_down = False
+        self.shutdown_drain_seconds = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', '20'))
+        self.drop_pending_updates = os.getenv('DROP_PENDING_UPDATES', 'false').lower() in ('1', 'true', 'yes')
+        self.shutdown_task: Optional[asyncio.Task] = None
+        # Preview mode: numbered thumbnails per chat, so /get can fetch items at full resolution
+        self.previews: Dict[int, dict] = {}
+        self.preview_ttl_seconds = 3600
+        self.preview_max_posts = 90
+        self.preview_pool: Optional[ProcessPoolExecutor] = None
+        # Browse mode: page-by-page delivery, later pages fetched only when asked for
+        self.browse_sessions: Dict[int, BrowseSession] = {}
+        self.browse_page_size = int(os.getenv('BROWSE_PAGE_SIZE', '10'))
+        self.browse_ttl_seconds = float(os.getenv('BROWSE_TTL_SECONDS', '900'))
+        # Speculative prefetch after /info, staged per (chat, username) until /download claims it
+        self.prefetch_enabled = os.getenv('PREFETCH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.prefetch_budget_bytes = int(float(os.getenv('PREFETCH_MAX_MB', '300')) * 1024 * 1024)
+        self.prefetch_ttl_seconds = float(os.getenv('PREFETCH_TTL_SECONDS', '600'))
+        self.prefetches: Dict[Tuple[int, str], StagedPrefetch] = {}
+        # One prefetch at a time, on its own thread and its own small Instagram request budget,
+        # so it never holds bulk-lane threads or reserves requests ahead of real jobs
+        self.prefetch_lane = ExecutionLane('prefetch', 1, float(os.getenv('PREFETCH_REQUESTS_PER_MINUTE', '6')))
+        # Temp directories: the ones in use, plus a reaper for orphans left by crashes
+        self.temp_root = bot_temp_root(token)
+        self.active_temp_dirs: set = set()
+        self.temp_reaper_interval = float(os.getenv('TEMP_REAPER_INTERVAL_SECONDS', '600'))
+        self.temp_max_age_seconds = float(os.getenv('TEMP_MAX_AGE_HOURS', '6')) * 3600
+        self.temp_budget_bytes = int(float(os.getenv('TEMP_BUDGET_MB', '2048')) * 1024 * 1024)
+        self.reaped_dirs = 0
+        self.reaped_bytes = 0
+        # On-demand sampling profiler (/profile, or SAMPLING_PROFILE_SECONDS at startup)
+        self.profiler: Optional[SamplingProfiler] = None
+        self.profile_interval = float(os.getenv('SAMPLING_PROFILE_INTERVAL_MS', '10')) / 1000
+        self.profile_max_seconds = 300
+        self.background_tasks: set = set()
         self.setup_handlers()
         
     def setup_handlers(self):
         """Setup all bot handlers"""
+        from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, filters
+        
         self.app.add_handler(CommandHandler("start", self.cmd_start))
         self.app.add_handler(CommandHandler("help", self.cmd_help))
         self.app.add_handler(CommandHandler("download", self.cmd_download))
@@ -45,6 +910,18 @@ class RobustInstagramBot:
         self.app.add_handler(CommandHandler("limit", self.cmd_download_limit))
         self.app.add_handler(CommandHandler("check", self.cmd_check))
         self.app.add_handler(CommandHandler("info", self.cmd_info))
+        self.app.add_handler(CommandHandler("browse", self.cmd_browse))
+        self.app.add_handler(CallbackQueryHandler(self.handle_browse_button, pattern=r'^(more|endbrowse):'))
+        self.app.add_handler(CommandHandler("preview", self.cmd_preview))
+        self.app.add_handler(CommandHandler("get", self.cmd_get))
+        self.app.add_handler(CommandHandler("stats", self.cmd_stats))
+        self.app.add_handler(CommandHandler("usage", self.cmd_usage))
+        self.app.add_handler(CommandHandler("profile", self.cmd_profile))
+        self.app.add_handler(CommandHandler("watch", self.cmd_watch))
+        self.app.add_handler(CommandHandler("unwatch", self.cmd_unwatch))
+        self.app.add_handler(CommandHandler("cancel", self.cmd_cancel))
+        self.app.add_handler(CallbackQueryHandler(self.handle_cancel_button, pattern=r'^cancel:'))
+        self.app.add_handler(InlineQueryHandler(self.handle_inline_query))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text))
         
     # ==================== USERNAME VALIDATION ====================
@@ -56,17 +933,37 @@ class RobustInstagramBot:
         """
         if not raw_input:
             return ""
+        # A post/reel link would otherwise become the username "p", "reel" or "tv"
+        if self.parse_post_url(raw_input):
+            return ""
             
         # Remove common prefixes and clean
         username = raw_input.strip()
         username = username.replace('@', '')
-        username = username.replace('instagram.com/', '')
-        username = username.replace('www.instagram.com/', '')
-        username = username.split('/')[-1]  # Handle URLs
         username = username.split('?')[0]   # Remove query params
+        username = re.sub(r'^(https?://)?(www\.|m\.)?instagram\.com/', '', username)
+        username = username.strip('/').split('/')[0]  # Handle URLs (instagram.com/user/reels/ -> user)
         
         return username.strip()
     
+    def parse_post_url(self, raw_input: str) -> Optional[str]:
+        """Shortcode of a single post/reel/IGTV link, or None if the input isn't one"""
+        match = re.match(r'^(https?://)?(www\.|m\.)?instagram\.com/([A-Za-z0-9._]+/)?(p|reels?|tv)/([A-Za-z0-9_-]+)',
+                         raw_input.strip())
+        return match.group(5) if match else None
+    
+    async def reject_post_link(self, update: Update, raw_input: str, command: str) -> bool:
+        """Explain that a profile command got a post link instead of a username; True if it did"""
+        if not self.parse_post_url(raw_input):
+            return False
+        await update.message.reply_text(
+            f"🔗 <b>That's a Post Link</b>\n\n"
+            f"/{command} works with a profile username, not a single post.\n"
+            f"To download this post, send /download {self.escape_html(raw_input.strip())}",
+            parse_mode='HTML'
+        )
+        return True
+    
     def is_valid_instagram_username(self, username: str) -> bool:
         """
         Comprehensive Instagram username validation
@@ -166,6 +1063,7 @@ Just send me any Instagram username:
 • /limit username 10 - Download specific number of posts
 • /check username - Validate username format
 • /info username - Get profile information
+• /cancel - Stop a running download
 • /help - Show detailed help
 
 <b>⚡ Features:</b>
@@ -204,9 +1102,27 @@ Try it now! Send me any Instagram username."""
 4. <b>Direct message:</b> Just type the username (25 posts)
    user_name_123
 
+   Or paste a post/reel link to get just that post:
+   https://instagram.com/p/ABC123xyz/
+
+5. <b>Filters</b> (add after the username on /download, /all, /limit):
+   /download nat.geo videos
+   /limit cristiano 20 since:2024-09-01 likes:100000
+   /all user_name_123 type:reel until:2024-12-31
+   Filters: images, videos, since:, until: (dates inclusive), likes:, type:image|video|carousel|reel
+
 <b>🔧 Utility Commands:</b>
 • /check username - Validate username format
 • /info username - Get profile details
+• /browse username - Get posts 10 at a time with a Next button
+• /preview username - Browse posts as numbered thumbnail collages
+• /get 3 7 - Download items from your last preview in full resolution
+• /cancel - Stop your running download
+• /stats - Show bot load and queue status
+• /watch username - Get new posts automatically (/watch alone lists them)
+• /unwatch username - Stop watching a profile
+• /usage - Your downloads today and your daily limits
+• @bot username (in any chat) - Share a profile card
 • /help - Show this help
 
 <b>📊 Download Limits:</b>
@@ -218,13 +1134,13 @@ Try it now! Send me any Instagram username."""
 <b>⚠️ Important Notes:</b>
 • Only public profiles work
 • Private profiles will show an error
-• Files over 50MB can't be sent via Telegram (Telegram's limit)
+• Files over 50MB can't be sent via Telegram (2GB with a local Bot API server)
 • ALL downloads can take very long for large profiles
 
 <b>🔧 Troubleshooting:</b>
 • If username fails, try /check username first
 • Use /info to verify profile exists
-• For large profiles, use /limit instead of /all
+• For large profiles, use /limit or /browse instead of /all
 • Wait between downloads to avoid rate limits
 
 <b>💡 Pro Tips:</b>
@@ -243,13 +1159,17 @@ Try it now! Send me any Instagram username."""
                 "Examples:\n"
                 "• /download cristiano\n"
                 "• /download user_name_123\n"
-                "• /download nat.geo",
+                "• /download nat.geo\n"
+                "• /download nat.geo videos since:2024-09-01",
                 parse_mode='HTML'
             )
             return
             
-        raw_username = ' '.join(context.args)
-        await self.process_download_request(update, raw_username)
+        raw_username = context.args[0]
+        post_filter = await self.parse_filters(update, context.args[1:])
+        if post_filter is None:
+            return
+        await self.process_download_request(update, raw_username, post_filter=post_filter)
         
     async def cmd_download_all(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /all command - download ALL posts"""
@@ -267,7 +1187,10 @@ Try it now! Send me any Instagram username."""
             )
             return
             
-        raw_username = ' '.join(context.args)
+        raw_username = context.args[0]
+        post_filter = await self.parse_filters(update, context.args[1:])
+        if post_filter is None:
+            return
         
         # Send warning for /all command
         warning_msg = await update.message.reply_text(
@@ -282,8 +1205,9 @@ Try it now! Send me any Instagram username."""
         username = self.normalize_username(raw_username)
         if self.is_valid_instagram_username(username):
             try:
-                loader = instaloader.Instaloader(quiet=True)
-                profile = instaloader.Profile.from_username(loader.context, username)
+                async with self.fast_lane.slot():
+                    profile = await self.fast_lane.run(self.fetch_profile, username)
+                self.release_profile(profile)  # Only the post count is needed
                 
                 if profile.mediacount > 100:
                     await warning_msg.edit_text(
@@ -312,7 +1236,7 @@ Try it now! Send me any Instagram username."""
                 # If profile check fails, just proceed
                 pass
         
-        await self.process_download_request(update, raw_username, download_all=True)
+        await self.process_download_request(update, raw_username, download_all=True, post_filter=post_filter)
         
     async def cmd_download_limit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /limit command - download specific number of posts"""
@@ -355,7 +1279,10 @@ Try it now! Send me any Instagram username."""
                 )
                 return
                 
-            await self.process_download_request(update, raw_username, post_limit=limit)
+            post_filter = await self.parse_filters(update, context.args[2:])
+            if post_filter is None:
+                return
+            await self.process_download_request(update, raw_username, post_limit=limit, post_filter=post_filter)
             
         except ValueError:
             await update.message.reply_text(
@@ -431,93 +1358,846 @@ Try it now! Send me any Instagram username."""
         raw_username = ' '.join(context.args)
         await self.get_profile_info(update, raw_username)
     
-    async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle direct username messages"""
-        raw_username = update.message.text.strip()
-        
-        # Skip if it looks like a command or random text
-        if raw_username.startswith('/') or len(raw_username) > 50 or ' ' in raw_username:
+    async def cmd_browse(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /browse command - deliver a profile page by page"""
+        if not context.args:
             await update.message.reply_text(
-                "🤔 That doesn't look like an Instagram username.\n\n"
-                "Send a username like:\n"
-                "• `cristiano`\n"
-                "• `nat.geo`\n\n"
-                "Or use `/help` for more information."
+                "📄 <b>Browse Mode</b>\n\n"
+                f"Get posts {self.browse_page_size} at a time. The next page is only downloaded "
+                "when you tap <b>Next</b>.\n\n"
+                "Usage: /browse username [filters]\n\n"
+                "Examples:\n"
+                "• /browse nat.geo\n"
+                "• /browse cristiano videos",
+                parse_mode='HTML'
             )
             return
-            
-        await self.process_download_request(update, raw_username)
-    
-    # ==================== CORE FUNCTIONALITY ====================
-    
-    async def process_download_request(self, update: Update, raw_username: str, download_all: bool = False, post_limit: Optional[int] = None):
-        """Process a download request with comprehensive error handling"""
-        # Normalize and validate username
-        username = self.normalize_username(raw_username)
         
+        if await self.reject_post_link(update, context.args[0], 'browse'):
+            return
+        username = self.normalize_username(context.args[0])
+        post_filter = await self.parse_filters(update, context.args[1:])
+        if post_filter is None:
+            return
         if not self.is_valid_instagram_username(username):
-            errors = self.get_validation_errors(username)
-            error_text = '\n'.join([f"• {error}" for error in errors])
             await update.message.reply_text(
-                f"❌ <b>Invalid Username Format</b>\n\n"
-                f"Input: {self.escape_html(raw_username)}\n"
-                f"Cleaned: {self.escape_html(username)}\n\n"
-                f"Issues:\n{error_text}\n\n"
-                f"Use /check {self.escape_html(raw_username)} for detailed validation.",
+                f"❌ Invalid username format: {self.escape_html(username)}\n\n"
+                f"Use /check {self.escape_html(username)} for validation details.",
                 parse_mode='HTML'
             )
             return
         
-        # Send initial status
-        status_msg = await update.message.reply_text(
-            f"🔍 <b>Checking Profile</b>\n\n"
-            f"👤 Username: {self.escape_html(username)}\n"
-            f"⏳ Connecting to Instagram...",
-            parse_mode='HTML'
-        )
+        if await self.reject_if_instagram_down(update):
+            return
         
+        self.purge_browse_sessions()
+        chat_id = update.effective_chat.id
+        profile = None
         try:
-            await self.download_instagram_content(update, status_msg, username, download_all, post_limit)
+            # Opening the listing is one metadata request - fast lane
+            async with self.fast_lane.slot():
+                profile = await self.fast_lane.run(self.fetch_profile, username)
+                if profile.is_private:
+                    self.release_profile(profile)
+                    await update.message.reply_text(
+                        f"🔒 <b>Private Profile</b>\n\n"
+                        f"👤 @{self.escape_html(profile.username)}\n\n"
+                        f"Only public profiles are supported by this bot.",
+                        parse_mode='HTML'
+                    )
+                    return
+                posts = await self.fast_lane.run(IndexedPosts, self.post_index, profile, budget=False)
+        except instaloader.exceptions.ProfileNotExistsException:
+            await update.message.reply_text(
+                f"❌ <b>Profile Not Found</b>\n\n"
+                f"👤 Username: {self.escape_html(username)}",
+                parse_mode='HTML'
+            )
+            return
         except Exception as e:
-            logger.error(f"Download failed for {username}: {e}")
-            await status_msg.edit_text(
-                f"💥 <b>Download Failed</b>\n\n"
-                f"👤 Username: {self.escape_html(username)}\n"
-                f"❌ Error: {self.escape_html(str(e)[:200])}...\n\n"
-                f"Try:\n"
-                f"• Check if profile is public\n"
-                f"• Wait a few minutes and retry\n"
-                f"• Use /info {self.escape_html(username)} to test connection",
+            logger.error(f"Browse failed for {username}: {e}")
+            self.release_profile(profile)
+            await update.message.reply_text(
+                f"❌ <b>Error Opening Profile</b>\n\n"
+                f"❌ Error: {self.escape_html(str(e)[:100])}...",
                 parse_mode='HTML'
             )
+            return
+        
+        # A new /browse replaces the chat's previous session
+        self.end_browse_session(chat_id)
+        session = BrowseSession(chat_id, update.effective_user.id if update.effective_user else None,
+                                username, posts, post_filter, self.browse_ttl_seconds)
+        self.browse_sessions[chat_id] = session
+        await self.deliver_browse_page(session)
     
-    async def get_profile_info(self, update: Update, raw_username: str):
-        """Get profile information without downloading"""
-        username = self.normalize_username(raw_username)
+    async def handle_browse_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the Next / Done buttons under a browse page"""
+        query = update.callback_query
+        action, _, session_id = query.data.partition(':')
+        session = self.browse_sessions.get(update.effective_chat.id)
         
-        if not self.is_valid_instagram_username(username):
-            await update.message.reply_text(
-                f"❌ Invalid username format: {self.escape_html(username)}\n\n"
-                f"Use /check {self.escape_html(username)} for validation details.",
+        if session is None or session.session_id != session_id or session.expired:
+            await query.answer("This browse session has expired. Start again with /browse.", show_alert=True)
+            await query.edit_message_reply_markup(reply_markup=None)
+            return
+        if session.user_id is not None and query.from_user.id != session.user_id:
+            await query.answer("Only the person who started browsing can use these buttons.", show_alert=True)
+            return
+        if session.lock.locked():
+            await query.answer("Still sending the current page...")
+            return
+        
+        await query.answer()
+        await query.edit_message_reply_markup(reply_markup=None)
+        if action == 'endbrowse':
+            self.end_browse_session(session.chat_id)
+            await self.app.bot.send_message(
+                session.chat_id,
+                f"✅ Finished browsing @{self.escape_html(session.username)} - "
+                f"{session.delivered} posts delivered.",
                 parse_mode='HTML'
             )
             return
+        await self.deliver_browse_page(session)
+    
+    async def next_browse_posts(self, session: BrowseSession) -> list:
+        """Pull the next page of matching posts from the live listing (metadata only)"""
+        posts = []
+        scanned = 0
+        async with self.fast_lane.slot():
+            while len(posts) < self.browse_page_size:
+                post = await self.fast_lane.next_post(session.posts)
+                if post is None or session.post_filter.past_window(post, session.scanned):
+                    session.exhausted = True
+                    break
+                session.scanned += 1
+                scanned += 1
+                if session.post_filter.matches(post):
+                    posts.append(post)
+                elif scanned >= self.browse_page_size * self.filter_scan_factor:
+                    break
+            await self.fast_lane.run(session.posts.save, budget=False)
+        return posts
+    
+    async def deliver_browse_page(self, session: BrowseSession):
+        """Download and send one page, then offer the next one"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
         
-        status_msg = await update.message.reply_text(
-            f"ℹ️ <b>Getting Profile Info</b>\n\n"
-            f"👤 Username: {self.escape_html(username)}\n"
-            f"⏳ Fetching data...",
-            parse_mode='HTML'
-        )
-        
-        try:
-            loader = instaloader.Instaloader(quiet=True)
-            profile = instaloader.Profile.from_username(loader.context, username)
-            
-            # Format follower counts
-            followers = self.format_number(profile.followers)
-            following = self.format_number(profile.followees)
-            posts = self.format_number(profile.mediacount)
+        async with session.lock:
+            if self.shutting_down:
+                # The live listing doesn't survive a restart
+                self.end_browse_session(session.chat_id)
+                await self.app.bot.send_message(
+                    session.chat_id,
+                    "🔄 The bot is restarting. Please start again with /browse in a moment."
+                )
+                return
+            try:
+                posts = await self.next_browse_posts(session)
+            except Exception as e:
+                logger.error(f"Browse paging failed for {session.username}: {e}")
+                self.end_browse_session(session.chat_id)
+                await self.app.bot.send_message(
+                    session.chat_id,
+                    f"❌ Could not load more posts from @{self.escape_html(session.username)}. "
+                    f"Try /browse again later.",
+                    parse_mode='HTML'
+                )
+                return
+            
+            quota_message = self.check_quota(session.user_id)
+            if quota_message:
+                self.end_browse_session(session.chat_id)
+                await self.app.bot.send_message(session.chat_id, quota_message, parse_mode='HTML')
+                return
+            
+            if posts:
+                job = DownloadJob(session.chat_id, session.user_id, session.username,
+                                  post_filter=session.post_filter, shortcodes=[post.shortcode for post in posts])
+                job.posts = posts
+                await self.execute_job(job)
+                session.pages += 1
+                session.delivered += len(posts)
+            session.touch()
+            # Sessions nobody comes back to are dropped at their TTL (releasing their pool lease)
+            asyncio.get_running_loop().call_later(self.browse_ttl_seconds + 1, self.purge_browse_sessions)
+            
+            if session.exhausted or not posts:
+                self.end_browse_session(session.chat_id)
+                await self.app.bot.send_message(
+                    session.chat_id,
+                    f"🏁 <b>End of Profile</b>\n\n"
+                    f"👤 @{self.escape_html(session.username)}: {session.delivered} posts delivered.",
+                    parse_mode='HTML'
+                )
+                return
+            
+            keyboard = InlineKeyboardMarkup([[
+                InlineKeyboardButton(f"▶️ Next {self.browse_page_size}", callback_data=f"more:{session.session_id}"),
+                InlineKeyboardButton("✅ Done", callback_data=f"endbrowse:{session.session_id}"),
+            ]])
+            await self.app.bot.send_message(
+                session.chat_id,
+                f"📄 <b>Page {session.pages}</b> of @{self.escape_html(session.username)}\n"
+                f"📥 {session.delivered} posts so far\n\n"
+                f"Tap Next for more (available for {int(self.browse_ttl_seconds // 60)} minutes).",
+                parse_mode='HTML',
+                reply_markup=keyboard
+            )
+    
+    def end_browse_session(self, chat_id: int):
+        """Forget a chat's browse session and hand back the pool session its listing pages through"""
+        session = self.browse_sessions.pop(chat_id, None)
+        if session is not None:
+            self.release_profile(session.posts.profile)
+    
+    def purge_browse_sessions(self):
+        """Drop expired browse sessions (and the listing state they hold)"""
+        for chat_id, session in list(self.browse_sessions.items()):
+            if session.expired and not session.lock.locked():
+                self.end_browse_session(chat_id)
+    
+    async def cmd_preview(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /preview command - numbered thumbnail collages instead of full downloads"""
+        if not context.args:
+            await update.message.reply_text(
+                "🖼️ <b>Preview Mode</b>\n\n"
+                "Browse a profile as small numbered collages, then fetch only what you want.\n\n"
+                "Usage: /preview username [number] [filters]\n\n"
+                "Examples:\n"
+                "• /preview nat.geo\n"
+                "• /preview cristiano 45\n"
+                "• /preview nat.geo 18 videos\n\n"
+                "Then: /get 3 7 12 or /get 1-5",
+                parse_mode='HTML'
+            )
+            return
+        
+        raw_username = context.args[0]
+        rest = list(context.args[1:])
+        count = 27
+        if rest and rest[0].isdigit():
+            count = max(1, min(int(rest.pop(0)), self.preview_max_posts))
+        post_filter = await self.parse_filters(update, rest)
+        if post_filter is None:
+            return
+        
+        if await self.reject_post_link(update, raw_username, 'preview'):
+            return
+        username = self.normalize_username(raw_username)
+        if not self.is_valid_instagram_username(username):
+            await update.message.reply_text(
+                f"❌ Invalid username format: {self.escape_html(username)}\n\n"
+                f"Use /check {self.escape_html(username)} for validation details.",
+                parse_mode='HTML'
+            )
+            return
+        
+        user = update.effective_user
+        quota_message = self.check_quota(user.id if user else None)
+        if quota_message:
+            await update.message.reply_text(quota_message, parse_mode='HTML')
+            return
+        if await self.reject_if_instagram_down(update):
+            return
+        
+        status_msg = await update.message.reply_text(
+            f"🖼️ <b>Building Preview</b>\n\n"
+            f"👤 Username: {self.escape_html(username)}\n"
+            f"⏳ Fetching thumbnails...",
+            parse_mode='HTML'
+        )
+        try:
+            async with self.bulk_lane.slot():
+                await self.build_preview(status_msg, update.effective_chat.id, username, count, post_filter,
+                                         user)
+        except instaloader.exceptions.ProfileNotExistsException:
+            await status_msg.edit_text(
+                f"❌ <b>Profile Not Found</b>\n\n"
+                f"👤 Username: {self.escape_html(username)}\n\n"
+                f"The profile doesn't exist or has been deleted.",
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.error(f"Preview failed for {username}: {e}")
+            await status_msg.edit_text(
+                f"❌ <b>Preview Failed</b>\n\n"
+                f"👤 Username: {self.escape_html(username)}\n"
+                f"❌ Error: {self.escape_html(str(e)[:100])}...\n\n"
+                f"This might be a temporary issue. Try again later.",
+                parse_mode='HTML'
+            )
+    
+    async def cmd_get(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /get command - full resolution download of items from the last preview"""
+        preview = self.previews.get(update.effective_chat.id)
+        if not preview or preview['expires'] < time.time():
+            self.previews.pop(update.effective_chat.id, None)
+            await update.message.reply_text(
+                "❌ <b>No Active Preview</b>\n\n"
+                "Run /preview username first, then pick items by number:\n"
+                "• /get 3 7 12\n"
+                "• /get 1-5",
+                parse_mode='HTML'
+            )
+            return
+        
+        shortcodes = preview['shortcodes']
+        numbers = []
+        try:
+            for token in ' '.join(context.args).replace(',', ' ').split():
+                first, _, last = token.partition('-')
+                numbers.extend(range(int(first), int(last or first) + 1))
+        except ValueError:
+            numbers = []
+        numbers = sorted(set(numbers))
+        
+        if not numbers or numbers[0] < 1 or numbers[-1] > len(shortcodes):
+            await update.message.reply_text(
+                f"❌ <b>Invalid Selection</b>\n\n"
+                f"Pick numbers between 1 and {len(shortcodes)}, e.g. /get 2 5 or /get 1-4",
+                parse_mode='HTML'
+            )
+            return
+        if len(numbers) > self.max_posts_per_request:
+            await update.message.reply_text(
+                f"❌ <b>Too Many Items</b>\n\n"
+                f"You can fetch up to {self.max_posts_per_request} items at once.",
+                parse_mode='HTML'
+            )
+            return
+        
+        job = DownloadJob(update.effective_chat.id,
+                          update.effective_user.id if update.effective_user else None,
+                          preview['username'], shortcodes=[shortcodes[n - 1] for n in numbers])
+        await self.submit_job(update, job)
+    
+    async def cmd_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cancel command - stop this chat's downloads"""
+        chat_id = update.effective_chat.id
+        chat_jobs = [job for job in self.jobs.values() if job.chat_id == chat_id and not job.cancelled]
+        if not chat_jobs:
+            await update.message.reply_text("🤷 Nothing to cancel - no download is running in this chat.")
+            return
+        
+        for job in chat_jobs:
+            job.cancel()
+        names = ', '.join(self.escape_html(job.username) for job in chat_jobs)
+        await update.message.reply_text(f"⏹️ Cancelling download of {names}...", parse_mode='HTML')
+    
+    async def handle_cancel_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the inline Cancel button on a job's status message"""
+        query = update.callback_query
+        job = self.jobs.get(query.data.split(':', 1)[1])
+        
+        if job is None:
+            await query.answer("This download has already finished.")
+            return
+        if job.user_id is not None and query.from_user.id != job.user_id:
+            await query.answer("Only the person who started this download can cancel it.", show_alert=True)
+            return
+        
+        job.cancel()
+        await query.answer("Cancelling...")
+    
+    async def cmd_usage(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /usage command - the user's own usage, or the top consumers for admins"""
+        user_id = update.effective_user.id
+        if context.args and context.args[0].lower() == 'top':
+            if user_id not in self.admin_ids:
+                await update.message.reply_text("⛔ Only bot admins can see other users' usage.")
+                return
+            days = 7 if len(context.args) > 1 and context.args[1] == 'week' else 1
+            rows = self.usage.top(days)
+            if not rows:
+                await update.message.reply_text("📊 No downloads recorded yet.")
+                return
+            lines = [
+                f"{rank}. {self.escape_html(name or uid)} ({uid}): {totals['posts']} posts, "
+                f"{totals['bytes'] / (1024 * 1024):.0f}MB, {totals['seconds'] / 60:.0f} min, {totals['jobs']} jobs"
+                for rank, (uid, name, totals) in enumerate(rows, 1)
+            ]
+            await update.message.reply_text(
+                f"🏆 <b>Top Users ({'last 7 days' if days == 7 else 'today'})</b>\n\n" + '\n'.join(lines),
+                parse_mode='HTML'
+            )
+            return
+        
+        today = self.usage.totals(user_id)
+        week = self.usage.totals(user_id, days=7)
+        
+        def limit(value, quota, unit=''):
+            return f"{value}{unit} / {quota:g}{unit}" if quota else f"{value}{unit} (no limit)"
+        
+        exempt = "\n👑 Admin - quotas don't apply to you." if user_id in self.admin_ids else ""
+        await update.message.reply_text(
+            f"📊 <b>Your Usage Today</b> (resets 00:00 UTC)\n\n"
+            f"📥 Posts: {limit(today['posts'], self.quota_posts_per_day)}\n"
+            f"📤 Uploaded: {limit(round(today['bytes'] / (1024 * 1024)), self.quota_mb_per_day, 'MB')}\n"
+            f"⏱️ Job time: {limit(round(today['seconds'] / 60), self.quota_job_minutes_per_day, ' min')}\n"
+            f"🧾 Jobs: {today['jobs']}\n\n"
+            f"<b>Last 7 days:</b> {week['posts']} posts, {week['bytes'] / (1024 * 1024):.0f}MB, "
+            f"{week['jobs']} jobs{exempt}",
+            parse_mode='HTML'
+        )
+    
+    def check_quota(self, user_id: Optional[int]) -> Optional[str]:
+        """Message explaining which daily quota is used up, or None if the user may start a job"""
+        if user_id is None or user_id in self.admin_ids:
+            return None
+        today = self.usage.totals(user_id)
+        exceeded = []
+        if self.quota_posts_per_day and today['posts'] >= self.quota_posts_per_day:
+            exceeded.append(f"{self.quota_posts_per_day} posts")
+        if self.quota_mb_per_day and today['bytes'] >= self.quota_mb_per_day * 1024 * 1024:
+            exceeded.append(f"{self.quota_mb_per_day:g}MB uploaded")
+        if self.quota_job_minutes_per_day and today['seconds'] >= self.quota_job_minutes_per_day * 60:
+            exceeded.append(f"{self.quota_job_minutes_per_day:g} minutes of downloading")
+        if not exceeded:
+            return None
+        return (f"🚫 <b>Daily Limit Reached</b>\n\n"
+                f"You've used today's allowance: {', '.join(exceeded)}.\n"
+                f"Limits reset at 00:00 UTC. See /usage for details.")
+    
+    def check_job_limit(self, user_id: Optional[int]) -> Optional[str]:
+        """
+        Message if the user already has max_jobs_per_user jobs queued or running, else None.
+        Usage is only recorded when a job ends, so without this cap a burst of /all commands
+        would all pass check_quota before the first one counted.
+        """
+        if user_id is None or user_id in self.admin_ids or not self.max_jobs_per_user:
+            return None
+        in_flight = sum(1 for job in self.jobs.values() if job.user_id == user_id)
+        if in_flight < self.max_jobs_per_user:
+            return None
+        return (f"🚦 <b>Too Many Downloads</b>\n\n"
+                f"You already have {in_flight} download{'s' if in_flight > 1 else ''} queued or running.\n"
+                f"Wait for one to finish (or cancel it) before starting another.")
+    
+    def record_usage(self, job: DownloadJob):
+        """Add a finished (or paused/cancelled) job run to its user's daily totals"""
+        if not job.started_at:
+            return
+        self.add_usage(job.user_id, job.user_name,
+                       posts=job.downloaded, bytes=job.uploaded_bytes,
+                       seconds=round(time.time() - job.started_at), jobs=0 if job.resumed else 1)
+    
+    def add_usage(self, user_id: Optional[int], name: Optional[str] = None, **amounts):
+        """Add work done for a user (a job run, a preview, a watch delivery) to today's totals"""
+        if user_id is None:
+            return
+        self.usage.record(user_id, name, **amounts)
+        self.spawn(asyncio.to_thread(self.usage.save))
+    
+    async def cmd_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /stats command - execution lane queue metrics"""
+        lines = []
+        for lane in (self.fast_lane, self.bulk_lane):
+            m = lane.metrics()
+            lines.append(
+                f"<b>{m['lane'].title()} lane</b> ({m['slots']} slots, {m['requests_per_minute']:g} req/min)\n"
+                f"• Running: {m['running']}  • Queued: {m['queued']}\n"
+                f"• Completed: {m['completed']}  • Failed: {m['failed']}\n"
+                f"• Wait avg/max: {m['avg_wait_s']}s / {m['max_wait_s']}s"
+            )
+        sessions = [
+            f"• {self.escape_html(s['name'])} ({self.escape_html(s['login'])}{', proxy' if s['proxy'] else ''}): "
+            f"{s['state']}, {s['in_flight']} active, {s['requests']} req, "
+            f"{s['errors']} err / {s['throttled']} 429, {s['latency_ms']}ms"
+            for s in self.session_pool.status()
+        ]
+        breaker = self.session_pool.breaker
+        retry_in = self.session_pool.unavailable_for()
+        sessions.append(f"• Circuit breaker: {breaker.state(time.time())}"
+                        f"{f', retry in {int(retry_in)}s' if retry_in else ''}, {breaker.rejected} rejected")
+        lines.append("<b>Instagram sessions</b>\n" + '\n'.join(sessions))
+        lines.append(
+            f"<b>Temp storage</b>\n"
+            f"• Active dirs: {len(self.active_temp_dirs)}\n"
+            f"• Reaped: {self.reaped_dirs} dirs, {self.reaped_bytes / (1024 * 1024):.1f}MB"
+        )
+        m = self.send_scheduler.metrics()
+        lines.append(
+            f"<b>Telegram sends</b>\n"
+            f"• Queued: {m['queued']} in {m['chats_waiting']} chats  • In flight: {m['in_flight']}\n"
+            f"• Sent: {m['sent']}  • Flood retries: {m['retried']}  • Max wait: {m['max_wait_s']}s"
+        )
+        if log_handler.dropped:
+            lines.append(f"<b>Logging</b>\n• Lines dropped (writer behind): {log_handler.dropped}")
+        await update.message.reply_text("📈 <b>Bot Load</b>\n\n" + '\n\n'.join(lines), parse_mode='HTML')
+    
+    async def cmd_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /profile command - admin only: sample the live process and send the stacks"""
+        if update.effective_user.id not in self.admin_ids:
+            await update.message.reply_text("⛔ Only bot admins can profile the bot.")
+            return
+        try:
+            seconds = int(context.args[0]) if context.args else 30
+        except ValueError:
+            seconds = 0
+        if not 1 <= seconds <= self.profile_max_seconds:
+            await update.message.reply_text(f"Usage: /profile seconds (1-{self.profile_max_seconds}, default 30)")
+            return
+        if self.profiler is not None and self.profiler.running:
+            await update.message.reply_text("⏱️ A profile is already being recorded - try again when it's done.")
+            return
+        
+        await update.message.reply_text(
+            f"⏱️ <b>Profiling for {seconds}s</b>\n\n"
+            f"Sampling every thread every {self.profile_interval * 1000:g}ms. "
+            f"The collapsed stacks will be sent here as a file.",
+            parse_mode='HTML'
+        )
+        data, summary, _ = await self.record_sampling_profile(seconds)
+        from telegram import InputFile
+        await self.app.bot.send_document(
+            update.effective_chat.id,
+            InputFile(data, filename=f"bot-profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"),
+            caption=summary[:1024]
+        )
+    
+    async def record_sampling_profile(self, seconds: float) -> Tuple[bytes, str, Path]:
+        """
+        Sample all threads for `seconds` and save the collapsed stacks under BOT_DATA_DIR/profiles.
+        Returns (file contents, text summary, saved path).
+        """
+        self.profiler = SamplingProfiler(self.profile_interval)
+        self.profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(self.profiler.stop)
+        profiler = self.profiler
+        data = profiler.collapsed().encode('utf-8')
+        path = DATA_DIR / 'profiles' / f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+        
+        def save():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        
+        await asyncio.to_thread(save)
+        hot = '\n'.join(f"{count:>6}  {function}" for function, count in profiler.hot_functions(5))
+        summary = (f"{profiler.samples} samples over {profiler.duration:.0f}s, "
+                   f"{profiler.busy_share():.0%} of thread samples busy\n"
+                   f"Hottest (self samples):\n{hot or '(idle)'}\n"
+                   f"Open with speedscope.app or flamegraph.pl")
+        logger.info(f"Sampling profile saved to {path}")
+        return data, summary, path
+    
+    async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle direct username messages"""
+        raw_username = update.message.text.strip()
+        
+        # Shared post/reel links are long (tracking parameters) - check them first
+        if self.parse_post_url(raw_username):
+            await self.process_download_request(update, raw_username)
+            return
+        
+        # Skip if it looks like a command or random text
+        if raw_username.startswith('/') or len(raw_username) > 50 or ' ' in raw_username:
+            await update.message.reply_text(
+                "🤔 That doesn't look like an Instagram username.\n\n"
+                "Send a username like:\n"
+                "• `cristiano`\n"
+                "• `nat.geo`\n\n"
+                "Or use `/help` for more information."
+            )
+            return
+            
+        await self.process_download_request(update, raw_username)
+    
+    # ==================== CORE FUNCTIONALITY ====================
+    
+    async def parse_filters(self, update: Update, tokens: List[str]) -> Optional[PostFilter]:
+        """Parse filter words after the username; replies and returns None if any are invalid"""
+        post_filter, errors = PostFilter.parse_tokens(tokens)
+        if errors:
+            error_text = '\n'.join(f"• {self.escape_html(error)}" for error in errors)
+            await update.message.reply_text(
+                f"❌ <b>Invalid Filters</b>\n\n"
+                f"{error_text}\n\n"
+                f"<b>Available filters:</b>\n"
+                f"• images / videos - only that media\n"
+                f"• since:2024-09-01 / until:2024-12-31 (both days included)\n"
+                f"• likes:1000 - minimum likes\n"
+                f"• type:image|video|carousel|reel",
+                parse_mode='HTML'
+            )
+            return None
+        return post_filter
+    
+    async def process_download_request(self, update: Update, raw_username: str, download_all: bool = False,
+                                       post_limit: Optional[int] = None, post_filter: Optional[PostFilter] = None):
+        """Process a download request with comprehensive error handling"""
+        # A post/reel link means just that post, not its owner's profile
+        shortcode = self.parse_post_url(raw_username)
+        if shortcode:
+            await self.process_post_request(update, shortcode, post_filter)
+            return
+        
+        # Normalize and validate username
+        username = self.normalize_username(raw_username)
+        
+        if not self.is_valid_instagram_username(username):
+            errors = self.get_validation_errors(username)
+            error_text = '\n'.join([f"• {error}" for error in errors])
+            await update.message.reply_text(
+                f"❌ <b>Invalid Username Format</b>\n\n"
+                f"Input: {self.escape_html(raw_username)}\n"
+                f"Cleaned: {self.escape_html(username)}\n\n"
+                f"Issues:\n{error_text}\n\n"
+                f"Use /check {self.escape_html(raw_username)} for detailed validation.",
+                parse_mode='HTML'
+            )
+            return
+        
+        job = DownloadJob(update.effective_chat.id,
+                          update.effective_user.id if update.effective_user else None,
+                          username, download_all, post_limit, post_filter)
+        await self.submit_job(update, job)
+    
+    async def process_post_request(self, update: Update, shortcode: str, post_filter: Optional[PostFilter] = None):
+        """Download a single post by shortcode: one lookup, no profile or pagination"""
+        # Refuse before the lookup spends a fast-lane slot and an Instagram request
+        user_id = update.effective_user.id if update.effective_user else None
+        quota_message = self.check_quota(user_id) or self.check_job_limit(user_id)
+        if quota_message:
+            await update.message.reply_text(quota_message, parse_mode='HTML')
+            return
+        if await self.reject_if_instagram_down(update):
+            return
+        try:
+            async with self.fast_lane.slot():
+                post = await self.fast_lane.run(self.fetch_post, shortcode)
+        except PoolExhausted as e:
+            await update.message.reply_text(
+                f"⏳ <b>Instagram Is Busy</b>\n\n"
+                f"All of the bot's Instagram connections are cooling down after rate limiting.\n"
+                f"Please try again in about {int(e.retry_in // 60) + 1} minutes.",
+                parse_mode='HTML'
+            )
+            return
+        except instaloader.exceptions.ConnectionException as e:
+            logger.warning(f"Post lookup failed for {shortcode}: {e}")
+            await update.message.reply_text(
+                f"🌐 <b>Connection Error</b>\n\n"
+                f"🔗 Post: {self.escape_html(shortcode)}\n\n"
+                f"Instagram connection failed. Please try again in a few minutes.",
+                parse_mode='HTML'
+            )
+            return
+        except instaloader.exceptions.InstaloaderException as e:
+            logger.info(f"Post {shortcode} not available: {e}")
+            await update.message.reply_text(
+                f"❌ <b>Post Not Found</b>\n\n"
+                f"🔗 Post: {self.escape_html(shortcode)}\n\n"
+                f"The post doesn't exist, was deleted, or belongs to a private account.",
+                parse_mode='HTML'
+            )
+            return
+        
+        job = DownloadJob(update.effective_chat.id, user_id,
+                          post.owner_username, post_filter=post_filter, shortcodes=[shortcode])
+        job.posts = [post]
+        await self.submit_job(update, job)
+    
+    async def reject_if_instagram_down(self, update: Update) -> bool:
+        """
+        Fail fast while the circuit breaker is open (or every pool session is quarantined):
+        tell the user when to retry instead of letting the request wait on timeouts.
+        """
+        retry_in = self.session_pool.unavailable_for()
+        if retry_in is None:
+            return False
+        minutes = int(retry_in // 60) + 1
+        await update.message.reply_text(
+            f"⏳ <b>Instagram Is Busy</b>\n\n"
+            f"Instagram is rate limiting the bot right now, so new requests are paused.\n"
+            f"Please try again in about {minutes} minute{'s' if minutes > 1 else ''}.",
+            parse_mode='HTML'
+        )
+        return True
+    
+    async def submit_job(self, update: Update, job: DownloadJob):
+        """Start a new job, or save it for after the restart if the bot is shutting down"""
+        quota_message = self.check_quota(job.user_id) or self.check_job_limit(job.user_id)
+        if quota_message:
+            await update.message.reply_text(quota_message, parse_mode='HTML')
+            return
+        if update.effective_user:
+            job.user_name = update.effective_user.username or update.effective_user.first_name
+        if await self.reject_if_instagram_down(update):
+            return
+        
+        if self.shutting_down:
+            # Don't start new work during shutdown - keep the request and run it after restart
+            self.jobs[job.job_id] = job
+            job.paused = True
+            self.save_jobs()
+            await update.message.reply_text(
+                f"🔄 <b>Bot Is Restarting</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n\n"
+                f"Your request has been saved and will start automatically in a moment.",
+                parse_mode='HTML'
+            )
+            return
+        
+        await self.execute_job(job)
+    
+    async def execute_job(self, job: DownloadJob):
+        """Run a (new or resumed) download job and report its outcome to the chat"""
+        username = job.username
+        set_log_context(job_id=job.job_id, username=username, chat_id=job.chat_id, stage='queued')
+        job.runner = asyncio.current_task()
+        self.jobs[job.job_id] = job
+        self.save_jobs()
+        
+        # Send initial status
+        if job.resumed:
+            status_text = (f"🔄 <b>Resuming Download</b>\n\n"
+                           f"👤 Username: {self.escape_html(username)}\n"
+                           f"The bot restarted while your download was in progress.\n"
+                           f"⏳ Files you already received won't be sent again.")
+        else:
+            status_text = (f"🔍 <b>Checking Profile</b>\n\n"
+                           f"👤 Username: {self.escape_html(username)}\n"
+                           f"⏳ Connecting to Instagram...")
+        status_msg = await self.app.bot.send_message(job.chat_id, status_text, parse_mode='HTML',
+                                                     reply_markup=self.cancel_markup(job))
+        
+        try:
+            # Run in a child task so /cancel can interrupt it at any await point
+            job.task = asyncio.create_task(self.run_download_job(status_msg, job))
+            if job.cancelled:
+                # Cancelled (or paused by shutdown) while the status message was being sent
+                job.task.cancel()
+            await job.task
+        except (asyncio.CancelledError, JobCancelled):
+            if not job.cancelled:
+                raise
+            if job.paused:
+                await self.report_paused(status_msg, job)
+            else:
+                await self.report_cancelled(status_msg, job)
+        except QuotaExceeded as e:
+            logger.info(f"Job {job.job_id} for {username} dropped: daily quota used up while it was queued")
+            await status_msg.edit_text(str(e), parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Download failed for {username}: {e}")
+            await status_msg.edit_text(
+                f"💥 <b>Download Failed</b>\n\n"
+                f"👤 Username: {self.escape_html(username)}\n"
+                f"❌ Error: {self.escape_html(str(e)[:200])}...\n\n"
+                f"Try:\n"
+                f"• Check if profile is public\n"
+                f"• Wait a few minutes and retry\n"
+                f"• Use /info {self.escape_html(username)} to test connection",
+                parse_mode='HTML'
+            )
+        finally:
+            self.record_usage(job)
+            # Paused jobs stay registered so the shutdown path persists them
+            if not job.paused:
+                self.jobs.pop(job.job_id, None)
+                self.save_jobs()
+    
+    async def run_download_job(self, status_msg, job: DownloadJob):
+        """Wait for a bulk lane slot, then download and deliver"""
+        # Real work takes priority over speculative prefetches (threads and request budget)
+        self.cancel_prefetches()
+        if self.bulk_lane.is_busy():
+            await status_msg.edit_text(
+                f"⏳ <b>Queued</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n"
+                f"📋 Jobs ahead of you: {self.bulk_lane.running + self.bulk_lane.queued}\n\n"
+                f"Your download starts as soon as a slot frees up.",
+                parse_mode='HTML',
+                reply_markup=self.cancel_markup(job)
+            )
+        async with self.bulk_lane.slot():
+            if job.cancelled:
+                raise JobCancelled()
+            # Jobs queued behind this user's earlier ones re-check the quota those jobs just used up
+            # (a resumed job had already started before the restart, so it may finish)
+            quota_message = None if job.resumed else self.check_quota(job.user_id)
+            if quota_message:
+                raise QuotaExceeded(quota_message)
+            job.started = True
+            job.started_at = time.time()
+            set_log_context(stage='download')
+            if job.shortcodes:
+                await self.download_shortcodes(status_msg, job)
+            else:
+                await self.download_instagram_content(status_msg, job.username, job.download_all,
+                                                      job.post_limit, job)
+    
+    def cancel_markup(self, job: DownloadJob):
+        """Inline keyboard with a Cancel button for a job's status message"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+        return InlineKeyboardMarkup([[InlineKeyboardButton("⏹️ Cancel", callback_data=f"cancel:{job.job_id}")]])
+    
+    async def report_paused(self, status_msg, job: DownloadJob):
+        """Tell the user their job was checkpointed for a restart"""
+        try:
+            await status_msg.edit_text(
+                f"⏸️ <b>Download Paused</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n"
+                f"📤 Files delivered so far: {job.sent}\n\n"
+                f"The bot is restarting. Your download will resume automatically.",
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.warning(f"Could not report pause of job {job.job_id}: {e}")
+    
+    async def report_cancelled(self, status_msg, job: DownloadJob):
+        """Tell the user the job stopped and what was already delivered"""
+        logger.info(f"Job {job.job_id} for {job.username} cancelled after {job.downloaded} posts, {job.sent} files sent")
+        try:
+            await status_msg.edit_text(
+                f"⏹️ <b>Download Cancelled</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n"
+                f"📥 Posts downloaded: {job.downloaded}\n"
+                f"📤 Files delivered: {job.sent}\n\n"
+                f"Temporary files have been removed.",
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.warning(f"Could not report cancellation of job {job.job_id}: {e}")
+    
+    async def get_profile_info(self, update: Update, raw_username: str):
+        """Get profile information without downloading"""
+        if await self.reject_post_link(update, raw_username, 'info'):
+            return
+        username = self.normalize_username(raw_username)
+        
+        if not self.is_valid_instagram_username(username):
+            await update.message.reply_text(
+                f"❌ Invalid username format: {self.escape_html(username)}\n\n"
+                f"Use /check {self.escape_html(username)} for validation details.",
+                parse_mode='HTML'
+            )
+            return
+        
+        if await self.reject_if_instagram_down(update):
+            return
+        
+        status_msg = await update.message.reply_text(
+            f"ℹ️ <b>Getting Profile Info</b>\n\n"
+            f"👤 Username: {self.escape_html(username)}\n"
+            f"⏳ Fetching data...",
+            parse_mode='HTML'
+        )
+        
+        profile = None
+        try:
+            async with self.fast_lane.slot():
+                profile = await self.fast_lane.run(self.fetch_profile, username)
+            
+            # Format follower counts
+            followers = self.format_number(profile.followers)
+            following = self.format_number(profile.followees)
+            posts = self.format_number(profile.mediacount)
             
             bio_text = profile.biography[:100] + '...' if len(profile.biography) > 100 else profile.biography
             info_text = f"""ℹ️ <b>Profile Information</b>
@@ -538,6 +2218,13 @@ Try it now! Send me any Instagram username."""
 Ready to download? Send /download {self.escape_html(username)}"""
             
             await status_msg.edit_text(info_text, parse_mode='HTML')
+            self.remember_profile(profile)
+            
+            # /download usually follows - get a head start while the lane is idle
+            # (the prefetch pages through the profile, so it takes over the pool lease)
+            if not profile.is_private and profile.mediacount > 0:
+                if self.start_prefetch(update.effective_chat.id, profile):
+                    profile = None
             
         except instaloader.exceptions.ProfileNotExistsException:
             await status_msg.edit_text(
@@ -556,34 +2243,207 @@ Ready to download? Send /download {self.escape_html(username)}"""
                 f"This might be a temporary issue. Try again later.",
                 parse_mode='HTML'
             )
+        finally:
+            self.release_profile(profile)
+    
+    # ==================== INLINE MODE ====================
+    
+    async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Answer "@bot username" with a shareable profile card. Cached summaries answer at once;
+        misses are looked up after the user stops typing, once per username.
+        """
+        query = update.inline_query
+        username = self.normalize_username(query.query)
+        if not username or not self.is_valid_instagram_username(username):
+            await query.answer([], cache_time=0, is_personal=True)
+            return
+        
+        entry = self.profile_cache.get(username)
+        if entry:
+            await query.answer([self.inline_profile_card(entry)], cache_time=60)
+            if not self.profile_cache.is_fresh(entry):
+                self.lookup_profile_summary(username)  # Refresh for the next query
+            return
+        
+        # Every keystroke is a new query - only look up what the user settles on
+        self.inline_latest[query.from_user.id] = query.id
+        await asyncio.sleep(self.inline_debounce_seconds)
+        if self.inline_latest.get(query.from_user.id) != query.id:
+            return  # Superseded; Telegram discards unanswered queries
+        self.inline_latest.pop(query.from_user.id, None)
+        
+        from telegram import InlineQueryResultArticle, InputTextMessageContent
+        try:
+            entry = await asyncio.wait_for(asyncio.shield(self.lookup_profile_summary(username)),
+                                           self.inline_answer_deadline - self.inline_debounce_seconds)
+            await query.answer([self.inline_profile_card(entry)], cache_time=60)
+        except asyncio.TimeoutError:
+            # The lookup keeps running and fills the cache for the next attempt
+            await query.answer([InlineQueryResultArticle(
+                id=f"wait:{username}", title=f"⏳ Looking up @{username}...",
+                description="Instagram is slow right now - type a character or try again in a moment",
+                input_message_content=InputTextMessageContent(f"https://instagram.com/{username}"),
+            )], cache_time=0, is_personal=True)
+        except instaloader.exceptions.ProfileNotExistsException:
+            await query.answer([InlineQueryResultArticle(
+                id=f"missing:{username}", title=f"❌ @{username} not found",
+                description="The profile doesn't exist or has been deleted",
+                input_message_content=InputTextMessageContent(f"❌ Instagram profile @{username} not found"),
+            )], cache_time=300)
+        except Exception as e:
+            logger.warning(f"Inline lookup failed for {username}: {e}")
+            await query.answer([], cache_time=0, is_personal=True)
+    
+    def lookup_profile_summary(self, username: str) -> asyncio.Task:
+        """Fetch a profile summary in the background; concurrent callers share one lookup"""
+        key = username.lower()
+        task = self.profile_lookups.get(key)
+        if task is None:
+            task = self.spawn(self.fetch_profile_summary(username))
+            self.profile_lookups[key] = task
+            task.add_done_callback(lambda _: self.profile_lookups.pop(key, None))
+            # Nobody may be waiting for it any more - don't log "exception never retrieved"
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+    
+    async def fetch_profile_summary(self, username: str) -> dict:
+        async with self.fast_lane.slot():
+            profile = await self.fast_lane.run(self.fetch_profile, username)
+        self.release_profile(profile)
+        return self.remember_profile(profile)
+    
+    def remember_profile(self, profile) -> dict:
+        """Cache a fetched profile's summary (and upload its picture once, if configured)"""
+        entry = self.profile_cache.update(profile)
+        self.spawn(asyncio.to_thread(self.profile_cache.save))
+        if self.inline_thumb_chat_id and not entry['thumb_file_id'] and entry['pic_url']:
+            self.spawn(self.upload_profile_thumbnail(profile))
+        return entry
+    
+    async def upload_profile_thumbnail(self, profile):
+        """Upload the profile picture to the storage chat so inline cards can reuse its file_id"""
+        try:
+            data = await asyncio.to_thread(profile._context.get_raw, profile.profile_pic_url_no_iphone)
+            message = await self.app.bot.send_photo(self.inline_thumb_chat_id, data.content,
+                                                    caption=f"@{profile.username}", disable_notification=True)
+            self.profile_cache.set_thumbnail(profile.username, message.photo[-1].file_id)
+            await asyncio.to_thread(self.profile_cache.save)
+        except Exception as e:
+            logger.info(f"Could not store profile picture of {profile.username}: {e}")
+    
+    def inline_profile_card(self, entry: dict):
+        """Inline result for a cached profile summary"""
+        from telegram import InlineQueryResultArticle, InlineQueryResultCachedPhoto, InputTextMessageContent
+        
+        username = entry['username']
+        verified = ' ✅' if entry['is_verified'] else ''
+        status = '🔒 Private' if entry['is_private'] else '🔓 Public'
+        counts = (f"{self.format_number(entry['posts'])} posts • "
+                  f"{self.format_number(entry['followers'])} followers • "
+                  f"{self.format_number(entry['following'])} following")
+        card = (f"👤 <b>{self.escape_html(entry['full_name'] or username)}</b>{verified}\n"
+                f"🔗 <a href=\"https://instagram.com/{username}\">@{self.escape_html(username)}</a>\n"
+                f"📊 {counts}\n"
+                f"{status}")
+        if entry.get('thumb_file_id'):
+            return InlineQueryResultCachedPhoto(
+                id=f"profile:{username.lower()}", photo_file_id=entry['thumb_file_id'],
+                title=f"@{username}", description=counts, caption=card, parse_mode='HTML',
+            )
+        return InlineQueryResultArticle(
+            id=f"profile:{username.lower()}",
+            title=f"{entry['full_name'] or username}{verified} (@{username})",
+            description=f"{counts}\n{status}",
+            input_message_content=InputTextMessageContent(card, parse_mode='HTML'),
+            thumbnail_url=entry['pic_url'] or None,
+        )
+    
+    def create_loader(self, temp_dir: str, post_filter: PostFilter, file_hashes: Dict[str, str],
+                      job: Optional[DownloadJob] = None,
+                      cancel_event: Optional[threading.Event] = None,
+                      oversized: Optional[List[Tuple[str, int]]] = None) -> 'instaloader.Instaloader':
+        """Instaloader set up for bot downloads into temp_dir"""
+        # Setup instaloader with optimal settings
+        loader = instaloader.Instaloader(
+            download_pictures=post_filter.download_pictures,
+            download_videos=post_filter.download_videos,
+            download_video_thumbnails=False,
+            download_geotags=False,
+            download_comments=False,
+            save_metadata=False,
+            post_metadata_txt_pattern="",
+            storyitem_metadata_txt_pattern="",
+            compress_json=False,
+            # Files land in <temp_dir>/<target>, i.e. the safe directory name passed to download_post
+            dirname_pattern=temp_dir + "/{target}",
+            quiet=True,
+            request_timeout=30
+        )
+        # Hash media as it is written so duplicates can be skipped when sending
+        install_hashing_writer(loader, file_hashes, job.cancel_event if job else cancel_event)
+        # Media Telegram won't accept is dropped from the response headers, not after downloading it
+        install_size_guard(loader, self.telegram_upload_limit_mb * 1024 * 1024,
+                           job.oversized if job else oversized if oversized is not None else [])
+        # Route through a pool session; the caller releases it when the download is done
+        self.session_pool.attach(loader)
+        return loader
+    
+    def fetch_profile(self, username: str):
+        """
+        Blocking profile lookup with a lightweight loader (run on a lane's threads).
+        Posts paged from the returned profile keep using the same pool session, which stays
+        leased until the caller is done with the listing and calls release_profile().
+        """
+        loader = instaloader.Instaloader(quiet=True, request_timeout=30)
+        self.session_pool.attach(loader)
+        try:
+            profile = instaloader.Profile.from_username(loader.context, username)
+        except BaseException:
+            self.session_pool.release(loader)
+            raise
+        profile.pool_loader = loader
+        return profile
+    
+    def release_profile(self, profile) -> None:
+        """Hand back the pool session of a fetch_profile() result (None is ignored)"""
+        self.session_pool.release(getattr(profile, 'pool_loader', None))
+    
+    def fetch_post(self, shortcode: str):
+        """Blocking single-post lookup by shortcode (run on a lane's threads)"""
+        loader = instaloader.Instaloader(quiet=True, request_timeout=30)
+        with self.session_pool.lease(loader):
+            post = instaloader.Post.from_shortcode(loader.context, shortcode)
+            post.owner_username  # Resolve here - it may need another request
+            return post
     
-    async def download_instagram_content(self, update: Update, status_msg, username: str, download_all: bool = False, post_limit: Optional[int] = None):
+    async def download_instagram_content(self, status_msg, username: str, download_all: bool = False,
+                                         post_limit: Optional[int] = None, job: Optional[DownloadJob] = None):
         """Download Instagram content with robust error handling"""
         temp_dir = None
+        loader = None
+        staged = None
+        reader = None
+        in_flight: set = set()  # Worker calls using the loader or temp dir, waited for on cancel
+        markup = self.cancel_markup(job) if job else None
+        post_filter = job.post_filter if job else PostFilter()
         
         try:
             # Create temporary directory
-            temp_dir = tempfile.mkdtemp(prefix=f"instagram_{username}_")
+            temp_dir = await self.make_temp_dir(f"{TEMP_DIR_PREFIX}{username}_")
             safe_dirname = self.create_safe_directory_name(username)
             
-            # Setup instaloader with optimal settings
-            loader = instaloader.Instaloader(
-                download_videos=True,
-                download_video_thumbnails=False,
-                download_geotags=False,
-                download_comments=False,
-                save_metadata=False,
-                post_metadata_txt_pattern="",
-                storyitem_metadata_txt_pattern="",
-                compress_json=False,
-                dirname_pattern=temp_dir + "/{profile}",
-                quiet=True,
-                request_timeout=30
-            )
+            file_hashes: Dict[str, str] = {}
+            loader = self.create_loader(temp_dir, post_filter, file_hashes, job)
+            # Posts prefetched after /info are moved over instead of downloaded again
+            # (prefetches hold both images and videos, so only for downloads without a media filter)
+            if post_filter.media is None:
+                staged = await self.claim_prefetch(status_msg.chat_id, username)
             
             # Get profile
             logger.info(f"Fetching profile: {username}")
-            profile = instaloader.Profile.from_username(loader.context, username)
+            profile = await self.bulk_lane.run(instaloader.Profile.from_username, loader.context, username,
+                                               track=in_flight)
             
             # Initialize download parameters early to avoid scope issues
             if download_all:
@@ -599,16 +2459,23 @@ Ready to download? Send /download {self.escape_html(username)}"""
                 max_posts = self.max_posts_per_request
                 download_type = f"DEFAULT ({self.max_posts_per_request})"
             
+            filter_line = ""
+            if not post_filter.is_empty():
+                filter_line = f"🔎 Filters: {self.escape_html(post_filter.describe())}\n"
+                total_to_download = f"up to {total_to_download}"
+            
             # Update status with profile info
             await status_msg.edit_text(
                 f"👤 <b>{self.escape_html(profile.full_name or profile.username)}</b>\n\n"
                 f"🔗 @{self.escape_html(profile.username)}\n"
                 f"📊 {self.format_number(profile.mediacount)} posts total\n"
-                f"� Dtownload type: {download_type}\n"
+                f"📥 Download type: {download_type}\n"
+                f"{filter_line}"
                 f"🎯 Target: {total_to_download} posts\n"
                 f"🔒 Status: {'Private' if profile.is_private else 'Public'}\n\n"
                 f"⬇️ Starting download...",
-                parse_mode='HTML'
+                parse_mode='HTML',
+                reply_markup=markup
             )
             
             # Check if private
@@ -629,14 +2496,46 @@ Ready to download? Send /download {self.escape_html(username)}"""
             
             logger.info(f"Starting {download_type} download of up to {total_to_download} posts for {username}")
             
-            for i, post in enumerate(profile.get_posts()):
-                if downloaded_count >= max_posts:
+            # Selective filters could otherwise walk a whole huge profile for a handful of matches
+            max_scanned = None if download_all or post_filter.is_empty() else max(max_posts * self.filter_scan_factor, 100)
+            scanned_count = 0
+            
+            # Pagination and downloads block on the network, so they run on worker threads.
+            # The listing comes from the post index where possible - only new posts are paginated,
+            # and the next page is fetched while the current one downloads - but not past the
+            # posts this job can use or the end of a since: window.
+            posts = await self.bulk_lane.run(IndexedPosts, self.post_index, profile, budget=False)
+            reader = ReadAhead(posts, self.bulk_lane, self.readahead_executor, self.readahead_pages,
+                               limit=max_posts if post_filter.is_empty() else max_scanned,
+                               stop=post_filter.past_window)
+            while downloaded_count < max_posts:
+                post = await reader.next()
+                if post is None:
+                    break
+                
+                # Filters run on listing metadata, before anything is fetched
+                scanned_count += 1
+                if post_filter.past_window(post, scanned_count - 1):
+                    logger.info(f"Reached posts older than filter window for {username} - stopping pagination")
                     break
+                if not post_filter.matches(post):
+                    if max_scanned and scanned_count >= max_scanned:
+                        logger.info(f"Filter scan limit ({max_scanned} posts) reached for {username}")
+                        break
+                    continue
                 
                 try:
-                    # Download post
-                    loader.download_post(post, target=safe_dirname)
+                    if staged is not None and post.shortcode in staged.files:
+                        if job:
+                            job.oversized.extend(staged.oversized.pop(post.shortcode, []))
+                        await self.bulk_lane.run(staged.move_post, post.shortcode, os.path.join(temp_dir, safe_dirname),
+                                                 file_hashes, budget=False, track=in_flight)
+                    else:
+                        # Download post
+                        await self.bulk_lane.run(loader.download_post, post, safe_dirname, track=in_flight)
                     downloaded_count += 1
+                    if job:
+                        job.downloaded = downloaded_count
                     
                     # Update progress every 3 posts
                     if downloaded_count % 3 == 0 or downloaded_count == 1:
@@ -646,18 +2545,26 @@ Ready to download? Send /download {self.escape_html(username)}"""
                             f"📥 Type: {download_type}\n"
                             f"⬇️ Downloaded: {downloaded_count}/{total_to_download}\n"
                             f"📁 Processing files...",
-                            parse_mode='HTML'
+                            parse_mode='HTML',
+                            reply_markup=markup
                         )
                     
                     # Small delay to prevent rate limiting
                     await asyncio.sleep(0.5)
                     
+                except PoolExhausted:
+                    raise  # Instagram is throttling us - the remaining posts would fail too
+                except JobCancelled:
+                    raise
                 except Exception as e:
                     logger.warning(f"Failed to download post {post.shortcode}: {e}")
                     continue
+            await reader.close()
+            await self.bulk_lane.run(posts.save, budget=False)
             
             # Send downloaded files
-            await self.send_downloaded_files(update, status_msg, temp_dir, safe_dirname, username, downloaded_count)
+            await self.send_downloaded_files(status_msg.chat_id, status_msg, temp_dir, safe_dirname, username,
+                                             downloaded_count, file_hashes, job)
             
         except instaloader.exceptions.ProfileNotExistsException:
             await status_msg.edit_text(
@@ -686,17 +2593,524 @@ Ready to download? Send /download {self.escape_html(username)}"""
                 f"Please try again in a few minutes.",
                 parse_mode='HTML'
             )
+        except PoolExhausted as e:
+            await status_msg.edit_text(
+                f"⏳ <b>Instagram Is Busy</b>\n\n"
+                f"👤 Username: {self.escape_html(username)}\n\n"
+                f"All of the bot's Instagram connections are cooling down after rate limiting.\n"
+                f"Please try again in about {int(e.retry_in // 60) + 1} minutes.",
+                parse_mode='HTML'
+            )
+        finally:
+            # Cleanup - after /cancel a worker thread may still be in the loader or writing to temp_dir
+            if reader is not None:
+                await reader.close()
+            await settle(in_flight)
+            if loader is not None:
+                self.session_pool.release(loader)
+            if staged is not None:
+                await self.remove_temp_dir(staged.temp_dir)
+            await self.remove_temp_dir(temp_dir)
+    
+    # ==================== SPECULATIVE PREFETCH ====================
+    
+    def start_prefetch(self, chat_id: int, profile) -> bool:
+        """
+        Start fetching a profile's first page in the background, if nothing real needs the bulk
+        lane. True if started; the prefetch then releases the profile's pool lease when done.
+        """
+        key = (chat_id, profile.username.lower())
+        if (not self.prefetch_enabled or self.shutting_down or key in self.prefetches
+                or self.bulk_lane.running or self.bulk_lane.queued or self.prefetch_lane.is_busy()):
+            return False
+        self.purge_prefetches()
+        if sum(entry.bytes for entry in self.prefetches.values()) >= self.prefetch_budget_bytes:
+            return False
+        entry = StagedPrefetch(chat_id, profile.username, self.prefetch_ttl_seconds)
+        self.prefetches[key] = entry
+        entry.task = self.spawn(self.run_prefetch(entry, profile))
+        return True
+    
+    async def run_prefetch(self, entry: StagedPrefetch, profile):
+        """Low-priority download of the first max_posts_per_request posts into the staging area"""
+        set_log_context(username=entry.username, chat_id=entry.chat_id, stage='prefetch')
+        lane = self.prefetch_lane
+        loader = None
+        try:
+            async with lane.slot():
+                entry.temp_dir = await self.make_temp_dir(f"{TEMP_DIR_PREFIX}prefetch_{entry.username}_")
+                skipped: List[Tuple[str, int]] = []
+                loader = self.create_loader(entry.temp_dir, PostFilter(), entry.file_hashes,
+                                            cancel_event=entry.cancel_event, oversized=skipped)
+                safe_dirname = self.create_safe_directory_name(entry.username)
+                posts = await lane.run(IndexedPosts, self.post_index, profile, budget=False)
+                while len(entry.files) < self.max_posts_per_request:
+                    # Back off as soon as a real job wants the bulk lane or the staging area is full
+                    if entry.cancel_event.is_set() or self.bulk_lane.running or self.bulk_lane.queued:
+                        break
+                    if sum(e.bytes for e in self.prefetches.values()) >= self.prefetch_budget_bytes:
+                        break
+                    post = await lane.next_post(posts)
+                    if post is None:
+                        break
+                    before = set(entry.file_hashes)
+                    await lane.run(loader.download_post, post, safe_dirname)
+                    new_files = [path for path in entry.file_hashes if path not in before]
+                    entry.files[post.shortcode] = new_files
+                    if skipped:
+                        entry.oversized[post.shortcode] = skipped[:]
+                        skipped.clear()
+                    entry.bytes += await asyncio.to_thread(lambda: sum(os.path.getsize(path) for path in new_files))
+                await lane.run(posts.save, budget=False)
+        except JobCancelled:
+            pass
+        except Exception as e:
+            logger.info(f"Prefetch for {entry.username} stopped: {e}")
+        finally:
+            if loader is not None:
+                self.session_pool.release(loader)
+            self.release_profile(profile)
+        logger.info(f"Prefetched {len(entry.files)} posts ({entry.bytes / (1024 * 1024):.1f}MB) "
+                    f"of {entry.username} for chat {entry.chat_id}")
+        # Unclaimed prefetches are dropped after their TTL
+        asyncio.get_running_loop().call_later(max(entry.expires - time.time(), 0), self.purge_prefetches)
+    
+    async def claim_prefetch(self, chat_id: int, username: str) -> Optional[StagedPrefetch]:
+        """Take over the chat's staged prefetch for username (stopping it if still running)"""
+        entry = self.prefetches.pop((chat_id, username.lower()), None)
+        if entry is None:
+            return None
+        entry.cancel_event.set()
+        if entry.task is not None and not entry.task.done():
+            await asyncio.wait({entry.task})
+        if entry.expires < time.time() or not entry.files:
+            await self.remove_temp_dir(entry.temp_dir)
+            return None
+        logger.info(f"Using {len(entry.files)} prefetched posts of {username} for chat {chat_id}")
+        return entry
+    
+    def cancel_prefetches(self):
+        """Stop running prefetches; what they already staged stays claimable"""
+        for entry in self.prefetches.values():
+            entry.cancel_event.set()
+    
+    def purge_prefetches(self, everything: bool = False):
+        """Drop expired (or all) finished prefetches and their files"""
+        now = time.time()
+        for key, entry in list(self.prefetches.items()):
+            if (everything or entry.expires < now) and (entry.task is None or entry.task.done()):
+                del self.prefetches[key]
+                self.spawn(self.remove_temp_dir(entry.temp_dir))
+    
+    # ==================== WATCH SUBSCRIPTIONS ====================
+    
+    async def cmd_watch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /watch command - subscribe this chat to a profile's new posts, or list subscriptions"""
+        chat_id = update.effective_chat.id
+        watching = self.watchlist.for_chat(chat_id)
+        if not context.args:
+            if not watching:
+                await update.message.reply_text(
+                    "👀 <b>No Watched Profiles</b>\n\n"
+                    "Usage: /watch username\n"
+                    "New posts of watched profiles are sent here automatically.",
+                    parse_mode='HTML'
+                )
+                return
+            lines = [f"• @{self.escape_html(watched.username)}" for watched in watching]
+            await update.message.reply_text(
+                f"👀 <b>Watched Profiles ({len(watching)}/{self.watch_max_per_chat})</b>\n\n" + '\n'.join(lines) +
+                "\n\nStop with /unwatch username",
+                parse_mode='HTML'
+            )
+            return
+        
+        if await self.reject_post_link(update, context.args[0], 'watch'):
+            return
+        username = self.normalize_username(context.args[0])
+        if not self.is_valid_instagram_username(username):
+            await update.message.reply_text(
+                f"❌ Invalid username format: {self.escape_html(username)}\n\n"
+                f"Use /check {self.escape_html(username)} for validation details.",
+                parse_mode='HTML'
+            )
+            return
+        if len(watching) >= self.watch_max_per_chat:
+            await update.message.reply_text(
+                f"❌ <b>Watch Limit Reached</b>\n\n"
+                f"This chat already watches {len(watching)} profiles. Use /unwatch to make room.",
+                parse_mode='HTML'
+            )
+            return
+        
+        user_id = update.effective_user.id if update.effective_user else None
+        if not self.watchlist.subscribe(username, chat_id, user_id):
+            await update.message.reply_text(f"👀 Already watching @{self.escape_html(username)} in this chat.",
+                                            parse_mode='HTML')
+            return
+        self.spawn(asyncio.to_thread(self.watchlist.save))
+        if self.watch_wakeup is not None:
+            self.watch_wakeup.set()
+        await update.message.reply_text(
+            f"👀 <b>Watching @{self.escape_html(username)}</b>\n\n"
+            f"New posts will be sent to this chat automatically.\n"
+            f"Profiles that post often are checked more often, quiet ones less.\n\n"
+            f"Stop with /unwatch {self.escape_html(username)}",
+            parse_mode='HTML'
+        )
+    
+    async def cmd_unwatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unwatch command"""
+        if not context.args:
+            await update.message.reply_text("Usage: /unwatch username\n\nSee /watch for the profiles you watch.")
+            return
+        username = self.normalize_username(context.args[0])
+        if not self.watchlist.unsubscribe(username, update.effective_chat.id):
+            await update.message.reply_text(f"🤷 This chat isn't watching @{self.escape_html(username)}.",
+                                            parse_mode='HTML')
+            return
+        self.spawn(asyncio.to_thread(self.watchlist.save))
+        await update.message.reply_text(f"✅ Stopped watching @{self.escape_html(username)}.", parse_mode='HTML')
+    
+    async def watch_loop(self):
+        """
+        Check watched profiles as they fall due, one at a time on the watch lane, paced by its
+        request budget. Each profile is checked once however many chats watch it.
+        """
+        self.watch_wakeup = asyncio.Event()
+        while not self.shutting_down:
+            watched = self.watchlist.next_due(time.time())
+            if watched is None:
+                self.watch_wakeup.clear()
+                delay = self.watchlist.seconds_until_due(time.time())
+                try:
+                    await asyncio.wait_for(self.watch_wakeup.wait(), min(delay if delay is not None else 3600, 3600))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.poll_watched(watched)
+            except Exception as e:
+                logger.error(f"Watch check for {watched.username} crashed: {e}")
+                self.watchlist.reschedule(watched, time.time(), failed=True)
+    
+    def check_watched(self, username: str):
+        """Blocking: the profile and its newest posts (the first page comes with the profile)"""
+        loader = instaloader.Instaloader(quiet=True, request_timeout=30)
+        with self.session_pool.lease(loader):
+            profile = instaloader.Profile.from_username(loader.context, username)
+            if profile.is_private:
+                return profile, []
+            return profile, list(itertools.islice(profile.get_posts(), 12))
+    
+    async def poll_watched(self, watched: WatchedProfile):
+        """Check one watched profile and push its new posts to every subscriber"""
+        now = time.time()
+        try:
+            async with self.watch_lane.slot():
+                profile, posts = await self.watch_lane.run(self.check_watched, watched.username)
+        except instaloader.exceptions.ProfileNotExistsException:
+            await self.watch_failed(watched, "doesn't exist any more")
+            return
+        except (instaloader.exceptions.InstaloaderException, PoolExhausted) as e:
+            interval = self.watchlist.reschedule(watched, now, failed=True)
+            logger.info(f"Watch check for {watched.username} failed, retrying in {interval / 60:.0f} min: {e}")
+            return
+        if profile.is_private:
+            await self.watch_failed(watched, "is private now")
+            return
+        
+        new_posts = watched.new_posts(posts) if watched.baselined else []
+        watched.record_check(posts, len(new_posts), now)
+        interval = self.watchlist.reschedule(watched, now)
+        logger.info(f"Watch check for {watched.username}: {len(new_posts)} new, "
+                    f"~{watched.posts_per_day:.2f} posts/day, next in {interval / 60:.0f} min",
+                    extra={'sample': True})
+        self.spawn(asyncio.to_thread(self.watchlist.save))
+        if new_posts:
+            self.spawn(self.deliver_watched_posts(watched, new_posts[-self.max_posts_per_request:]))
+    
+    async def watch_failed(self, watched: WatchedProfile, reason: str):
+        """Not found / private: retry a few times (could be transient), then drop the watch"""
+        watched.failures += 1
+        if watched.failures < MAX_FAILURES:
+            self.watchlist.reschedule(watched, time.time(), failed=True)
+            return
+        self.watchlist.drop(watched.username)
+        self.spawn(asyncio.to_thread(self.watchlist.save))
+        for chat_key in list(watched.subscribers):
+            try:
+                await self.app.bot.send_message(
+                    int(chat_key),
+                    f"👀 Stopped watching @{self.escape_html(watched.username)} - the profile {reason}.",
+                    parse_mode='HTML'
+                )
+            except Exception as e:
+                logger.info(f"Could not notify chat {chat_key} about {watched.username}: {e}")
+    
+    async def deliver_watched_posts(self, watched: WatchedProfile, posts: list):
+        """Download new posts once, then send them to every subscribed chat (re-sent by file_id)"""
+        from telegram import LinkPreviewOptions
+        from telegram.error import Forbidden
+        
+        set_log_context(username=watched.username, stage='watch')
+        temp_dir = None
+        loader = None
+        try:
+            safe_dirname = self.create_safe_directory_name(watched.username)
+            file_hashes: Dict[str, str] = {}
+            async with self.bulk_lane.slot():
+                temp_dir = await self.make_temp_dir(f"{TEMP_DIR_PREFIX}watch_{watched.username}_")
+                loader = self.create_loader(temp_dir, PostFilter(), file_hashes, oversized=[])
+                for post in posts:
+                    try:
+                        await self.bulk_lane.run(loader.download_post, post, safe_dirname)
+                    except Exception as e:
+                        logger.warning(f"Failed to download post {post.shortcode}: {e}")
+            scanned = await asyncio.to_thread(scan_media_dir, Path(temp_dir) / safe_dirname) or []
+            media = [(path, size, 'video' if path.suffix.lower() in ('.mp4', '.mov') else 'photo')
+                     for path, size in sorted(scanned) if path.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp', '.mp4', '.mov')]
+            links = '\n'.join(f"• https://instagram.com/p/{post.shortcode}/" for post in posts)
+            
+            for chat_key, subscriber in list(watched.subscribers.items()):
+                chat_id = int(chat_key)
+                # Deliveries count toward the subscriber's daily quota; once it is used up only links are sent
+                user_id = subscriber.get('user_id')
+                over_quota = self.check_quota(user_id) is not None
+                try:
+                    await self.app.bot.send_message(
+                        chat_id,
+                        f"🔔 <b>New from @{self.escape_html(watched.username)}</b>\n\n{links}" +
+                        ("\n\n🚫 Media not sent: today's allowance is used up (see /usage)." if over_quota else ""),
+                        parse_mode='HTML', link_preview_options=LinkPreviewOptions(is_disabled=True)
+                    )
+                    if over_quota:
+                        continue
+                    uploaded_bytes = 0
+                    for media_file, size, kind in media[:15]:
+                        digest = file_hashes.get(str(media_file)) or await asyncio.to_thread(hash_file, media_file)
+                        if await self.send_media_file(chat_id, media_file, kind, digest, size):
+                            uploaded_bytes += size
+                    self.add_usage(user_id, posts=len(posts), bytes=uploaded_bytes)
+                except Forbidden:
+                    # Bot was blocked or removed from the chat
+                    logger.info(f"Chat {chat_id} unreachable - removing its watch of {watched.username}")
+                    self.watchlist.unsubscribe(watched.username, chat_id)
+                    self.spawn(asyncio.to_thread(self.watchlist.save))
+                except Exception as e:
+                    logger.warning(f"Could not deliver new posts of {watched.username} to chat {chat_id}: {e}")
+            await asyncio.to_thread(self.media_index.save)
+        finally:
+            if loader is not None:
+                self.session_pool.release(loader)
+            await self.remove_temp_dir(temp_dir)
+    
+    def get_preview_pool(self) -> ProcessPoolExecutor:
+        """Process pool for image work (created on first preview; spawn keeps workers clean)"""
+        if self.preview_pool is None:
+            workers = int(os.getenv('PREVIEW_WORKERS', str(min(4, os.cpu_count() or 1))))
+            self.preview_pool = ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+        return self.preview_pool
+    
+    def fetch_thumbnail(self, post) -> bytes:
+        """Blocking download of a post's small thumbnail (through the post's own pool session)"""
+        return post._context.get_raw(pick_thumbnail_url(post)).content
+    
+    async def build_preview(self, status_msg, chat_id: int, username: str, count: int, post_filter: PostFilter,
+                            user=None):
+        """Send numbered 3x3 thumbnail collages of a profile's latest posts (counted as user's usage)"""
+        started_at = time.time()
+        try:
+            import PIL  # noqa: F401 - optional dependency, only needed for previews
+        except ImportError:
+            await status_msg.edit_text(
+                "❌ <b>Preview Unavailable</b>\n\n"
+                "Preview mode needs the Pillow package on the server (pip install Pillow).",
+                parse_mode='HTML'
+            )
+            return
+        
+        profile = await self.bulk_lane.run(self.fetch_profile, username)
+        try:
+            if profile.is_private:
+                await status_msg.edit_text(
+                    f"🔒 <b>Private Profile</b>\n\n"
+                    f"👤 @{self.escape_html(profile.username)}\n\n"
+                    f"Only public profiles are supported by this bot.",
+                    parse_mode='HTML'
+                )
+                return
+            
+            # Only thumbnails are fetched here: a few KB per post instead of full images/videos
+            items = []  # (shortcode, is_video, thumbnail bytes)
+            scanned = 0
+            posts = await self.bulk_lane.run(IndexedPosts, self.post_index, profile, budget=False)
+            while len(items) < count:
+                post = await self.bulk_lane.next_post(posts)
+                if post is None:
+                    break
+                scanned += 1
+                if post_filter.past_window(post, scanned - 1):
+                    break
+                if not post_filter.matches(post):
+                    if scanned >= count * self.filter_scan_factor:
+                        break
+                    continue
+                try:
+                    thumbnail = await self.bulk_lane.run(self.fetch_thumbnail, post, budget=False)
+                except Exception as e:
+                    logger.warning(f"Thumbnail failed for {post.shortcode}: {e}")
+                    thumbnail = b''
+                items.append((post.shortcode, post.typename != 'GraphImage', thumbnail))
+                if len(items) % 9 == 0:
+                    await status_msg.edit_text(
+                        f"🖼️ <b>Building Preview</b>\n\n"
+                        f"👤 Username: {self.escape_html(username)}\n"
+                        f"⬇️ Thumbnails: {len(items)}/{count}",
+                        parse_mode='HTML'
+                    )
+            await self.bulk_lane.run(posts.save, budget=False)
+        finally:
+            self.release_profile(profile)
+        
+        if not items:
+            await status_msg.edit_text(
+                f"❌ <b>Nothing To Preview</b>\n\n"
+                f"👤 Username: {self.escape_html(username)}\n\n"
+                f"No posts matched.",
+                parse_mode='HTML'
+            )
+            return
+        
+        self.previews[chat_id] = {
+            'username': username,
+            'shortcodes': [shortcode for shortcode, _, _ in items],
+            'expires': time.time() + self.preview_ttl_seconds,
+        }
+        
+        # Downsizing and packing run in parallel on the process pool
+        loop = asyncio.get_running_loop()
+        pool = self.get_preview_pool()
+        chunks = [items[start:start + 9] for start in range(0, len(items), 9)]
+        collages = await asyncio.gather(*[
+            loop.run_in_executor(pool, build_collage, [thumb for _, _, thumb in chunk], index * 9 + 1,
+                                 [is_video for _, is_video, _ in chunk])
+            for index, chunk in enumerate(chunks)
+        ])
+        
+        for index, (chunk, collage) in enumerate(zip(chunks, collages)):
+            first = index * 9 + 1
+            await self.app.bot.send_photo(
+                chat_id, collage,
+                caption=f"@{username} · {first}–{first + len(chunk) - 1} of {len(items)}"
+            )
+        if user is not None:
+            self.add_usage(user.id, user.username or user.first_name, posts=len(items),
+                           bytes=sum(len(collage) for collage in collages),
+                           seconds=round(time.time() - started_at), jobs=1)
+        
+        await status_msg.edit_text(
+            f"🖼️ <b>Preview Ready</b>\n\n"
+            f"👤 Username: {self.escape_html(username)}\n"
+            f"📊 Items: {len(items)} ▶ = video or carousel with video\n\n"
+            f"Pick items to download at full resolution:\n"
+            f"• /get 3 7 12\n"
+            f"• /get 1-5\n\n"
+            f"⏳ Selection valid for {self.preview_ttl_seconds // 60} minutes.",
+            parse_mode='HTML'
+        )
+    
+    async def download_shortcodes(self, status_msg, job: DownloadJob):
+        """Download specific posts by shortcode and send them"""
+        temp_dir = None
+        loader = None
+        in_flight: set = set()  # Worker calls using the loader or temp dir, waited for on cancel
+        try:
+            temp_dir = await self.make_temp_dir(f"{TEMP_DIR_PREFIX}{job.username}_")
+            safe_dirname = self.create_safe_directory_name(job.username)
+            file_hashes: Dict[str, str] = {}
+            loader = self.create_loader(temp_dir, job.post_filter, file_hashes, job)
+            
+            await status_msg.edit_text(
+                f"⬇️ <b>Downloading Selected Posts</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n"
+                f"🎯 Posts: {len(job.shortcodes)}",
+                parse_mode='HTML',
+                reply_markup=self.cancel_markup(job)
+            )
+            
+            downloaded_count = 0
+            known_posts = {post.shortcode: post for post in job.posts or []}
+            # Posts from a recent listing (e.g. the /preview they were picked from) need no lookup
+            indexed_nodes = await self.bulk_lane.run(self.post_index.fresh_nodes, job.username, budget=False)
+            for shortcode in job.shortcodes:
+                try:
+                    post = known_posts.get(shortcode)
+                    if post is None and shortcode in indexed_nodes:
+                        post = instaloader.Post(loader.context, indexed_nodes[shortcode])
+                    if post is None:
+                        post = await self.bulk_lane.run(instaloader.Post.from_shortcode, loader.context, shortcode,
+                                                        track=in_flight)
+                    await self.bulk_lane.run(loader.download_post, post, safe_dirname, track=in_flight)
+                    downloaded_count += 1
+                    job.downloaded = downloaded_count
+                except PoolExhausted:
+                    raise  # Instagram is throttling us - the remaining posts would fail too
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Failed to download post {shortcode}: {e}")
+            
+            await self.send_downloaded_files(status_msg.chat_id, status_msg, temp_dir, safe_dirname, job.username,
+                                             downloaded_count, file_hashes, job)
+        except instaloader.exceptions.ConnectionException:
+            await status_msg.edit_text(
+                f"🌐 <b>Connection Error</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n\n"
+                f"Instagram connection failed. Please try again in a few minutes.",
+                parse_mode='HTML'
+            )
+        except PoolExhausted as e:
+            await status_msg.edit_text(
+                f"⏳ <b>Instagram Is Busy</b>\n\n"
+                f"👤 Username: {self.escape_html(job.username)}\n\n"
+                f"All of the bot's Instagram connections are cooling down after rate limiting.\n"
+                f"Please try again in about {int(e.retry_in // 60) + 1} minutes.",
+                parse_mode='HTML'
+            )
         finally:
-            # Cleanup
-            if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            # After /cancel a worker thread may still be in the loader or writing to temp_dir
+            await settle(in_flight)
+            if loader is not None:
+                self.session_pool.release(loader)
+            await self.remove_temp_dir(temp_dir)
     
-    async def send_downloaded_files(self, update: Update, status_msg, temp_dir: str, 
-                                  safe_dirname: str, original_username: str, downloaded_count: int):
-        """Send downloaded files to user"""
+    async def send_downloaded_files(self, chat_id: int, status_msg, temp_dir: str, 
+                                  safe_dirname: str, original_username: str, downloaded_count: int,
+                                  file_hashes: Optional[Dict[str, str]] = None, job: Optional[DownloadJob] = None):
+        """Send downloaded files to user, skipping duplicate media by content hash"""
+        set_log_context(stage='send')
         profile_dir = Path(temp_dir) / safe_dirname
+        file_hashes = file_hashes if file_hashes is not None else {}
+        oversized_line = ""
+        if job and job.oversized:
+            largest = max(size for _, size in job.oversized) / (1024 * 1024)
+            oversized_line = (f"📦 Too large for Telegram, not downloaded: {len(job.oversized)} "
+                              f"(over {self.telegram_upload_limit_mb}MB, largest {largest:.0f}MB)\n")
         
-        if not profile_dir.exists():
+        # Directory listing and stat calls run off the event loop
+        scanned = await asyncio.to_thread(scan_media_dir, profile_dir)
+        if scanned is None and oversized_line:
+            await status_msg.edit_text(
+                f"📦 <b>Nothing Telegram Can Accept</b>\n\n"
+                f"👤 Username: {self.escape_html(original_username)}\n"
+                f"{oversized_line}\n"
+                f"Telegram bots can only send files up to {self.telegram_upload_limit_mb}MB.",
+                parse_mode='HTML'
+            )
+            return
+        if scanned is None:
             await status_msg.edit_text(
                 f"❌ <b>No Files Downloaded</b>\n\n"
                 f"👤 Username: {self.escape_html(original_username)}\n\n"
@@ -710,7 +3124,8 @@ Ready to download? Send /download {self.escape_html(username)}"""
             return
         
         # Get all files
-        all_files = list(profile_dir.glob("*"))
+        file_sizes = dict(scanned)
+        all_files = sorted(file_sizes)
         image_files = [f for f in all_files if f.suffix.lower() in ['.jpg', '.jpeg', '.png', '.webp']]
         video_files = [f for f in all_files if f.suffix.lower() in ['.mp4', '.mov', '.avi']]
         
@@ -734,62 +3149,266 @@ Ready to download? Send /download {self.escape_html(username)}"""
             f"🖼️ Images: {len(image_files)}\n"
             f"🎥 Videos: {len(video_files)}\n\n"
             f"📤 Sending files to Telegram...",
-            parse_mode='HTML'
+            parse_mode='HTML',
+            reply_markup=self.cancel_markup(job) if job else None
         )
         
         # Send files
         sent_count = 0
+        duplicate_count = 0
         max_files_to_send = 15  # Reasonable limit for Telegram
+        # A resumed job has already delivered some content - don't send it twice
+        sent_digests = set(job.delivered_digests) if job else set()
         
-        # Send images first
-        for img_file in image_files[:max_files_to_send]:
+        # Send images first, then videos (pacing is done by the send scheduler)
+        media_queue = [(f, 'photo') for f in image_files] + [(f, 'video') for f in video_files]
+        for media_file, kind in media_queue:
+            if sent_count >= max_files_to_send:
+                break
             try:
-                file_size_mb = img_file.stat().st_size / (1024 * 1024)
-                if file_size_mb < self.telegram_upload_limit_mb:
-                    with open(img_file, 'rb') as f:
-                        await update.message.reply_photo(f)
-                    sent_count += 1
-                    await asyncio.sleep(0.5)  # Rate limiting
-                else:
-                    logger.info(f"Skipping large image: {img_file.name} ({file_size_mb:.1f}MB) - exceeds Telegram's 50MB limit")
+                file_size = file_sizes[media_file]
+                file_size_mb = file_size / (1024 * 1024)
+                if file_size_mb >= self.telegram_upload_limit_mb:
+                    logger.info(f"Skipping large {kind}: {media_file.name} ({file_size_mb:.1f}MB) - "
+                                f"exceeds the {self.telegram_upload_limit_mb}MB upload limit", extra={'sample': True})
+                    continue
+                
+                digest = file_hashes.get(str(media_file))
+                if digest is None:
+                    digest = await asyncio.to_thread(hash_file, media_file)
+                
+                # Same bytes already delivered in this job (repost / cross-post)
+                if digest in sent_digests:
+                    duplicate_count += 1
+                    logger.info(f"Skipping duplicate {kind}: {media_file.name}", extra={'sample': True})
+                    continue
+                
+                uploaded = await self.send_media_file(chat_id, media_file, kind, digest, file_size)
+                sent_digests.add(digest)
+                sent_count += 1
+                if job:
+                    job.sent += 1
+                    if uploaded:
+                        job.uploaded_bytes += file_size
+                    job.delivered_digests.add(digest)
             except Exception as e:
-                logger.error(f"Failed to send image {img_file}: {e}")
+                logger.error(f"Failed to send {kind} {media_file}: {e}")
         
-        # Send videos
-        remaining_slots = max_files_to_send - sent_count
-        for vid_file in video_files[:remaining_slots]:
+        await asyncio.to_thread(self.media_index.save)
+        
+        if job:
+            # Sending is done - the Cancel button no longer applies
             try:
-                file_size_mb = vid_file.stat().st_size / (1024 * 1024)
-                if file_size_mb < self.telegram_upload_limit_mb:
-                    with open(vid_file, 'rb') as f:
-                        await update.message.reply_video(f)
-                    sent_count += 1
-                    await asyncio.sleep(1)  # Longer delay for videos
-                else:
-                    logger.info(f"Skipping large video: {vid_file.name} ({file_size_mb:.1f}MB) - exceeds Telegram's 50MB limit")
+                await status_msg.edit_reply_markup(reply_markup=None)
             except Exception as e:
-                logger.error(f"Failed to send video {vid_file}: {e}")
+                logger.debug(f"Could not remove cancel button: {e}")
+        
+        # Duplicates were delivered once already, so they count as handled
+        handled_count = sent_count + duplicate_count
+        duplicate_line = f"♻️ Duplicates skipped: {duplicate_count}\n" if duplicate_count else ""
         
         # Final summary
-        if sent_count < total_files:
-            await update.message.reply_text(
+        if handled_count < total_files:
+            await self.app.bot.send_message(
+                chat_id,
                 f"📤 <b>Files Sent: {sent_count}/{total_files}</b>\n\n"
+                f"{duplicate_line}"
+                f"{oversized_line}"
                 f"Some files were skipped due to:\n"
-                f"• File size &gt; 50MB (Telegram's limit)\n"
+                f"• File size &gt; {self.telegram_upload_limit_mb}MB (Telegram's limit)\n"
                 f"• Telegram sending limits\n"
                 f"• Network issues\n\n"
                 f"💡 For complete downloads, use the CLI version!",
                 parse_mode='HTML'
             )
         else:
-            await update.message.reply_text(
+            await self.app.bot.send_message(
+                chat_id,
                 f"🎉 <b>All {sent_count} files sent successfully!</b>\n\n"
                 f"👤 Profile: {self.escape_html(original_username)}\n"
                 f"📥 Posts: {downloaded_count}\n"
-                f"📤 Files: {sent_count}",
+                f"📤 Files: {sent_count}\n"
+                f"{duplicate_line}"
+                f"{oversized_line}",
                 parse_mode='HTML'
             )
     
+    async def send_media_file(self, chat_id: int, media_file: Path, kind: str, digest: str, file_size: int) -> bool:
+        """
+        Send one photo/video. Content already uploaded in an earlier job is
+        re-sent by its Telegram file_id instead of being uploaded again.
+        Returns True if the file was actually uploaded.
+        """
+        send = self.app.bot.send_photo if kind == 'photo' else self.app.bot.send_video
+        
+        def reply(media):
+            return send(chat_id, media)
+        
+        cached_file_id = self.media_index.get(digest, kind)
+        if cached_file_id:
+            try:
+                await reply(cached_file_id)
+                return False
+            except Exception as e:
+                # file_id no longer valid - fall back to a normal upload
+                logger.info(f"Cached file_id rejected for {media_file.name}: {e}")
+                self.media_index.forget(digest)
+        
+        if self.local_mode:
+            # The local Bot API server reads the file straight from disk - no multipart upload
+            message = await reply(media_file)
+        else:
+            from telegram import InputFile
+            data = await asyncio.to_thread(media_file.read_bytes)
+            message = await reply(InputFile(data, filename=media_file.name))
+        
+        if kind == 'photo' and message.photo:
+            self.media_index.record(digest, kind, message.photo[-1].file_id, file_size)
+        elif kind == 'video' and message.video:
+            self.media_index.record(digest, kind, message.video.file_id, file_size)
+        return True
+    
+    # ==================== LIFECYCLE ====================
+    
+    def save_jobs(self):
+        """Persist all queued, running and paused jobs"""
+        try:
+            save_json_file(self.jobs_file, [job.to_dict() for job in self.jobs.values()])
+        except OSError as e:
+            logger.warning(f"Could not save job queue: {e}")
+    
+    async def make_temp_dir(self, prefix: str) -> str:
+        """Create a working directory (off the event loop) that the reaper leaves alone while in use"""
+        path = await asyncio.to_thread(make_temp_dir, self.temp_root, prefix)
+        self.active_temp_dirs.add(path)
+        return path
+    
+    async def remove_temp_dir(self, path: Optional[str]):
+        """Delete a working directory off the event loop"""
+        if not path:
+            return
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+        self.active_temp_dirs.discard(path)
+    
+    async def reap_temp_dirs(self, max_age_seconds: Optional[float] = None):
+        """Remove orphaned temp dirs and log what was reclaimed"""
+        if max_age_seconds is None:
+            max_age_seconds = self.temp_max_age_seconds
+        try:
+            removed, reclaimed = await asyncio.to_thread(reap_temp_dirs, self.temp_root, set(self.active_temp_dirs),
+                                                         max_age_seconds, self.temp_budget_bytes)
+        except OSError as e:
+            logger.warning(f"Temp dir reaper failed: {e}")
+            return
+        if removed:
+            self.reaped_dirs += removed
+            self.reaped_bytes += reclaimed
+            logger.info(f"🧹 Removed {removed} stale temp dir(s), reclaimed {reclaimed / (1024 * 1024):.1f}MB")
+    
+    async def temp_reaper_loop(self):
+        """Periodically sweep orphaned temp dirs under the bot's temp root"""
+        while not self.shutting_down:
+            await asyncio.sleep(self.temp_reaper_interval)
+            await self.reap_temp_dirs()
+    
+    def spawn(self, coro) -> asyncio.Task:
+        """Start a background task and keep a reference until it finishes"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+    
+    def resume_saved_jobs(self):
+        """Re-enqueue jobs that were pending or in progress when the bot last stopped"""
+        saved = load_json_file(self.jobs_file, [])
+        if not saved:
+            return
+        
+        jobs = []
+        for data in saved:
+            try:
+                jobs.append(DownloadJob.from_dict(data))
+            except (KeyError, TypeError) as e:
+                logger.warning(f"Skipping unreadable saved job {data!r}: {e}")
+        # Register all of them before any starts, so the job file never loses one. Jobs that were
+        # running go first; ones that were still queued are new requests again and must fit the
+        # user's job limit (their quota is checked when they get a bulk slot, as for any job)
+        jobs.sort(key=lambda job: (not job.resumed, job.created_at))
+        restored = []
+        for job in jobs:
+            limit_message = None if job.resumed else self.check_job_limit(job.user_id)
+            if limit_message:
+                logger.info(f"Saved job {job.job_id} for {job.username} dropped: over the user's job limit")
+                self.spawn(self.app.bot.send_message(
+                    job.chat_id,
+                    f"🔄 Your queued download of {self.escape_html(job.username)} was dropped "
+                    f"when the bot restarted.\n\n" + limit_message,
+                    parse_mode='HTML'))
+                continue
+            self.jobs[job.job_id] = job
+            restored.append(job)
+        for job in restored:
+            self.spawn(self.execute_job(job))
+        self.save_jobs()
+        logger.info(f"🔄 Resuming {len(restored)} saved job(s)")
+    
+    def install_signal_handlers(self):
+        """Route SIGTERM/SIGINT (platform redeploys, Ctrl+C) to the graceful shutdown path"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Windows: Ctrl+C still stops the bot; jobs are persisted on every change anyway
+                logger.debug(f"Signal handler for {sig!r} not supported on this platform")
+    
+    def request_shutdown(self):
+        """First signal: drain and checkpoint. Second signal: stop right away."""
+        if self.shutdown_task is None:
+            self.shutdown_task = asyncio.get_running_loop().create_task(self.graceful_shutdown())
+        else:
+            logger.warning("Second stop signal received - stopping immediately")
+            self.save_jobs()
+            self.app.stop_running()
+    
+    async def graceful_shutdown(self):
+        """
+        Stop accepting jobs, give running downloads a short deadline to finish,
+        then pause (checkpoint) everything left so it resumes after restart.
+        """
+        self.shutting_down = True
+        logger.info(f"🛑 Shutdown requested - draining jobs for up to {self.shutdown_drain_seconds:g}s")
+        
+        # Queued jobs haven't started any work - pause them straight away
+        for job in list(self.jobs.values()):
+            if not job.started and not job.paused:
+                job.cancel(pause=True)
+        
+        running = [job.runner for job in self.jobs.values() if job.runner and not job.runner.done()]
+        if running:
+            await asyncio.wait(running, timeout=self.shutdown_drain_seconds)
+        
+        # Deadline passed - checkpoint whatever is still running
+        for job in list(self.jobs.values()):
+            if job.runner and not job.runner.done():
+                job.cancel(pause=True)
+        running = [job.runner for job in self.jobs.values() if job.runner and not job.runner.done()]
+        if running:
+            # Let the paused jobs clean up temp dirs and notify their chats
+            await asyncio.wait(running, timeout=5)
+        
+        self.save_jobs()
+        self.usage.save()
+        self.profile_cache.save()
+        self.watchlist.save()
+        self.cancel_prefetches()
+        self.purge_prefetches(everything=True)
+        if self.preview_pool is not None:
+            self.preview_pool.shutdown(wait=False, cancel_futures=True)
+        paused = sum(1 for job in self.jobs.values() if job.paused)
+        logger.info(f"💾 Saved {paused} job(s) for resumption - stopping")
+        self.app.stop_running()
+    
     # ==================== UTILITY FUNCTIONS ====================
     
     def escape_html(self, text: str) -> str:
@@ -805,17 +3424,44 @@ Ready to download? Send /download {self.escape_html(username)}"""
         else:
             return str(num)
     
+    async def post_init(self, application):
+        """Runs once the bot is connected, right before polling starts"""
+        self.startup_profiler.mark('connect to Telegram')
+        self.startup_profiler.report(logger.info, [
+            f"instaloader: {'loaded' if instaloader.loaded else 'not loaded (lazy)'}",
+            "(run with python -X importtime for per-module import cost)"])
+        # Warm up instaloader off the event loop so the first download doesn't pay for the import
+        asyncio.get_running_loop().run_in_executor(None, instaloader.load)
+        self.install_signal_handlers()
+        # Nothing is running yet, so every dir under this bot's temp root is left over from its previous process
+        await self.reap_temp_dirs(max_age_seconds=0)
+        self.spawn(self.temp_reaper_loop())
+        self.spawn(self.watch_loop())
+        # Profile the first minutes after startup without needing a chat command
+        startup_profile_seconds = float(os.getenv('SAMPLING_PROFILE_SECONDS', '0'))
+        if startup_profile_seconds > 0:
+            self.spawn(self.record_sampling_profile(startup_profile_seconds))
+        self.resume_saved_jobs()
+    
     def run(self):
         """Start the bot"""
         logger.info("🤖 Starting Robust Instagram Downloader Bot...")
         logger.info(f"📊 Max posts per request: {self.max_posts_per_request}")
         logger.info(f"📁 Max processing size: {self.max_file_size_mb}MB, Telegram upload limit: {self.telegram_upload_limit_mb}MB")
-        self.app.run_polling(drop_pending_updates=True)
+        for lane in (self.fast_lane, self.bulk_lane):
+            logger.info(f"🛣️ {lane.name} lane: {lane.concurrency} slots, {lane.requests_per_minute:g} Instagram requests/min")
+        logger.info(f"🌐 Instagram session pool: {len(self.session_pool)} session(s)")
+        logger.info(f"👀 Watching {len(self.watchlist)} profile(s) within {self.watch_requests_per_hour:g} requests/hour")
+        # Stop signals are handled by graceful_shutdown (see install_signal_handlers)
+        self.app.run_polling(drop_pending_updates=self.drop_pending_updates, stop_signals=None)
 
 # ==================== MAIN FUNCTION ====================
 
 def main():
     """Main function to start the bot"""
+    profiler = StartupProfiler(_STARTUP_T0, '--profile-startup' in sys.argv or bool(os.getenv('PROFILE_STARTUP')))
+    profiler.mark('module imports')
+    
     # Get bot token
     token = os.getenv('TELEGRAM_BOT_TOKEN')
     
@@ -832,7 +3478,10 @@ def main():
     
     try:
         # Create and start bot
-        bot = RobustInstagramBot(token)
+        import telegram.ext  # noqa: F401 - timed separately from bot setup
+        profiler.mark('import telegram.ext')
+        bot = RobustInstagramBot(token, profiler)
+        profiler.mark('bot setup')
         bot.run()
     except KeyboardInterrupt:
         print("\n👋 Bot stopped by user")
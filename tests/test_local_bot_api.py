@@ -0,0 +1,157 @@
+"""
+Uploads through a self-hosted Bot API server (TELEGRAM_API_URL), against a local fake
+The fake records every Bot API call, so the tests can check that local mode hands
+the server file paths instead of multipart uploads and raises the size limit to 2000MB.
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+import telegram_bot
+
+MB = 1024 * 1024
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    """Answers /bot<token>/<method> like the Bot API server and records each call"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeBotApiHandler)
+        self.calls = []  # (method, content type, raw body)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def sent(self, method: str) -> list:
+        return [call for call in self.calls if call[0] == method]
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.calls.append((method, self.headers.get('Content-Type', ''), body))
+        message = {'message_id': len(self.server.calls), 'date': 0, 'chat': {'id': 42, 'type': 'private'}}
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        elif method == 'sendPhoto':
+            result = dict(message, photo=[{'file_id': 'photo-id', 'file_unique_id': 'p', 'width': 1, 'height': 1}])
+        elif method == 'sendVideo':
+            result = dict(message, video={'file_id': 'video-id', 'file_unique_id': 'v', 'width': 1,
+                                          'height': 1, 'duration': 1})
+        else:
+            result = message
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeStatusMessage:
+    async def edit_text(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def server():
+    fake = FakeBotApi()
+    yield fake
+    fake.shutdown()
+    fake.server_close()
+
+
+def make_bot(monkeypatch, tmp_path, server, local_mode: bool):
+    monkeypatch.setattr(telegram_bot, 'DATA_DIR', tmp_path / 'data')
+    monkeypatch.setenv('TELEGRAM_API_URL', server.url)
+    monkeypatch.setenv('TELEGRAM_LOCAL_MODE', 'true' if local_mode else 'false')
+    return telegram_bot.RobustInstagramBot('123:TEST')
+
+
+def sparse_file(path, size: int):
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    return path
+
+
+def params(call) -> dict:
+    """Parameters of a recorded call that carried no file upload"""
+    _, content_type, body = call
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+def sent_media(call) -> str:
+    """The photo/video parameter of a recorded call, or 'multipart' for a real upload"""
+    if call[1].startswith('multipart/'):
+        return 'multipart'
+    return params(call)['photo' if call[0] == 'sendPhoto' else 'video']
+
+
+def test_local_mode_uploads_by_file_path(monkeypatch, tmp_path, server):
+    bot = make_bot(monkeypatch, tmp_path, server, local_mode=True)
+    photo = tmp_path / 'photo.jpg'
+    photo.write_bytes(b'jpeg')
+
+    async def run():
+        await bot.app.bot.initialize()
+        uploaded = await bot.send_media_file(42, photo, 'photo', 'digest', 4)
+        await bot.app.bot.shutdown()
+        return uploaded
+
+    assert asyncio.run(run())
+    [call] = server.sent('sendPhoto')
+    assert sent_media(call) == photo.absolute().as_uri()
+    assert bot.media_index.get('digest', 'photo') == 'photo-id'
+
+
+def test_local_mode_sends_files_up_to_2000mb(monkeypatch, tmp_path, server):
+    bot = make_bot(monkeypatch, tmp_path, server, local_mode=True)
+    assert bot.telegram_upload_limit_mb == 2000
+    profile_dir = tmp_path / 'job' / 'someone'
+    profile_dir.mkdir(parents=True)
+    medium = sparse_file(profile_dir / 'medium.mp4', 60 * MB)  # Over the cloud API's 50MB
+    sparse_file(profile_dir / 'huge.mp4', 2001 * MB)
+
+    async def run():
+        await bot.app.bot.initialize()
+        await bot.send_downloaded_files(42, FakeStatusMessage(), str(tmp_path / 'job'), 'someone', 'someone', 2,
+                                        {str(medium): 'medium-digest'})
+        await bot.app.bot.shutdown()
+
+    asyncio.run(run())
+    assert [sent_media(call) for call in server.sent('sendVideo')] == [medium.absolute().as_uri()]
+    assert 'Files Sent: 1/2' in params(server.sent('sendMessage')[-1])['text']
+
+
+def test_cloud_mode_keeps_50mb_limit_and_multipart_uploads(monkeypatch, tmp_path, server):
+    bot = make_bot(monkeypatch, tmp_path, server, local_mode=False)
+    assert bot.telegram_upload_limit_mb == 50
+    profile_dir = tmp_path / 'job' / 'someone'
+    profile_dir.mkdir(parents=True)
+    small = profile_dir / 'small.mp4'
+    small.write_bytes(b'mp4')
+    sparse_file(profile_dir / 'medium.mp4', 60 * MB)
+
+    async def run():
+        await bot.app.bot.initialize()
+        await bot.send_downloaded_files(42, FakeStatusMessage(), str(tmp_path / 'job'), 'someone', 'someone', 2,
+                                        {str(small): 'small-digest'})
+        await bot.app.bot.shutdown()
+
+    asyncio.run(run())
+    assert [sent_media(call) for call in server.sent('sendVideo')] == ['multipart']
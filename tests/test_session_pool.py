@@ -0,0 +1,173 @@
+"""
+SessionPool and CircuitBreaker against a local fake of Instagram's CDN
+Each identity's proxy is a small http.server that answers every request with
+the status code the test gives it, so throttling and failover can be exercised
+without touching the network.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instaloader
+import pytest
+
+from session_pool import (QUARANTINE_BASE_SECONDS, CircuitBreaker, CircuitOpen, PoolExhausted,
+                          PooledIdentity, SessionPool)
+
+MEDIA_URL = 'http://cdn.instagram.test/v/photo.jpg'
+
+
+class FakeInstagram(ThreadingHTTPServer):
+    """Plain-HTTP proxy stand-in: answers every request itself with `status`"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeInstagramHandler)
+        self.status = 200
+        self.hits = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeInstagramHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits += 1
+        body = b'jpeg' if self.server.status == 200 else b'{"message": "Please wait a few minutes"}'
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    for name in ('HTTP_PROXY', 'http_proxy', 'ALL_PROXY', 'all_proxy', 'NO_PROXY', 'no_proxy'):
+        monkeypatch.delenv(name, raising=False)
+    started = [FakeInstagram(), FakeInstagram()]
+    yield started
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def make_pool(servers, breaker=None) -> SessionPool:
+    return SessionPool([PooledIdentity(f"proxy{i}", proxy=server.url) for i, server in enumerate(servers)],
+                       breaker or CircuitBreaker(failures=100))
+
+
+def fetch(pool: SessionPool) -> PooledIdentity:
+    """One media request through a freshly attached loader; returns the identity it used"""
+    loader = instaloader.Instaloader(quiet=True, request_timeout=5)
+    with pool.lease(loader) as identity:
+        loader.context.get_raw(MEDIA_URL)
+    return identity
+
+
+def test_429_quarantines_identity(servers):
+    pool = make_pool(servers[:1])
+    servers[0].status = 429
+
+    with pytest.raises(instaloader.exceptions.ConnectionException):
+        fetch(pool)
+
+    identity = pool.identities[0]
+    assert identity.is_quarantined(time.time())
+    assert identity.recent('throttled') == 1
+    with pytest.raises(PoolExhausted) as raised:
+        pool.pick()
+    assert raised.value.retry_in > QUARANTINE_BASE_SECONDS - 5
+
+
+def test_fails_over_to_healthy_identity(servers):
+    pool = make_pool(servers)
+    servers[0].status = 429
+
+    with pytest.raises(instaloader.exceptions.ConnectionException):
+        fetch(pool)  # Both idle: the first identity is picked and gets throttled
+    assert fetch(pool).name == 'proxy1'
+    assert fetch(pool).name == 'proxy1'
+    assert servers[1].hits == 2
+
+
+def test_repeat_quarantine_backs_off(servers):
+    pool = make_pool(servers[:1])
+    identity = pool.identities[0]
+    servers[0].status = 429
+
+    durations = []
+    for _ in range(3):
+        identity.quarantined_until = 0.0  # Let the previous quarantine run out
+        with pytest.raises(instaloader.exceptions.ConnectionException):
+            fetch(pool)
+        durations.append(round(identity.quarantined_until - time.time()))
+    assert durations == [QUARANTINE_BASE_SECONDS, 2 * QUARANTINE_BASE_SECONDS, 4 * QUARANTINE_BASE_SECONDS]
+
+
+def test_probe_after_quarantine(servers):
+    pool = make_pool(servers[:1])
+    identity = pool.identities[0]
+    servers[0].status = 429
+    with pytest.raises(instaloader.exceptions.ConnectionException):
+        fetch(pool)
+    identity.quarantined_until = 0.0
+
+    # Fresh out of quarantine: a single probe request at a time
+    probe = instaloader.Instaloader(quiet=True)
+    with pool.lease(probe):
+        assert identity.probing
+        with pytest.raises(PoolExhausted):
+            pool.pick()
+        servers[0].status = 200
+        probe.context.get_raw(MEDIA_URL)
+    assert not identity.probing
+    assert identity.strikes == 0
+    assert pool.pick() is identity
+
+
+def test_breaker_opens_and_closes_after_probe(servers):
+    breaker = CircuitBreaker(failures=2, window=60, cooldown=30)
+    pool = make_pool(servers, breaker)
+    for server in servers:
+        server.status = 500
+
+    for _ in range(2):
+        with pytest.raises(instaloader.exceptions.ConnectionException):
+            fetch(pool)
+    assert breaker.state(time.time()) == 'open'
+    hits = sum(server.hits for server in servers)
+    with pytest.raises(CircuitOpen):
+        fetch(pool)
+    assert sum(server.hits for server in servers) == hits  # Rejected without a request
+    assert pool.unavailable_for() > 25
+
+    # Cooldown over: one probe; success closes the breaker
+    breaker.open_until = 0.0
+    assert breaker.state(time.time()) == 'half-open'
+    for server in servers:
+        server.status = 200
+    fetch(pool)
+    assert breaker.state(time.time()) == 'closed'
+    fetch(pool)
+
+
+def test_failed_probe_reopens_breaker_for_longer(servers):
+    breaker = CircuitBreaker(failures=1, window=60, cooldown=30)
+    pool = make_pool(servers, breaker)
+    for server in servers:
+        server.status = 500
+
+    with pytest.raises(instaloader.exceptions.ConnectionException):
+        fetch(pool)
+    breaker.open_until = 0.0
+    with pytest.raises(instaloader.exceptions.ConnectionException):
+        fetch(pool)  # The half-open probe fails
+    assert breaker.state(time.time()) == 'open'
+    assert breaker.retry_in(time.time()) > 55
@@ -0,0 +1,192 @@
+"""
+Persistent /watch subscriptions for the Telegram bot
+Each watched profile is stored once, with all chats subscribed to it, and
+carries its own adaptive polling schedule: profiles that post often are checked
+often, dormant ones rarely, and the whole list is stretched to fit a fixed
+Instagram request budget.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEEN_SHORTCODES = 50              # Recent shortcodes remembered per profile (pinned posts reappear)
+TARGET_NEW_POSTS_PER_CHECK = 0.5  # Expected new posts between checks (two checks per new post)
+JITTER = 0.2                      # +-20% on every interval, so checks don't bunch up
+MAX_FAILURES = 3                  # Consecutive "not found/private" results before a watch is dropped
+
+
+class WatchedProfile:
+    """One watched profile: its subscribers and its polling state"""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.subscribers: Dict[str, dict] = {}  # str(chat_id) -> {'user_id', 'since'}
+        self.seen: List[str] = []  # Recent shortcodes, newest first
+        self.last_post_at = 0.0    # Timestamp of the newest post seen
+        self.posts_per_day: Optional[float] = None  # Moving estimate, None until the first check
+        self.last_check = 0.0
+        self.next_check = 0.0
+        self.interval = 0.0  # Last scheduled interval, doubled on errors
+        self.failures = 0
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'WatchedProfile':
+        watched = cls(data['username'])
+        for key, value in data.items():
+            if hasattr(watched, key):
+                setattr(watched, key, value)
+        return watched
+
+    @property
+    def baselined(self) -> bool:
+        """False until the first check has recorded which posts already exist"""
+        return self.posts_per_day is not None
+
+    def new_posts(self, posts: Iterable) -> list:
+        """Posts (oldest first) that are newer than anything seen so far"""
+        seen = set(self.seen)
+        fresh = [post for post in posts
+                 if post.shortcode not in seen and post.date_utc.timestamp() > self.last_post_at]
+        return sorted(fresh, key=lambda post: post.date_utc)
+
+    def record_check(self, posts: list, new_count: int, now: float) -> None:
+        """Update what was seen and the posting rate estimate after a successful check"""
+        timestamps = [post.date_utc.timestamp() for post in posts]
+        if not self.baselined:
+            # First check: estimate the rate from the first page's age span
+            span_days = (now - min(timestamps)) / 86400 if timestamps else 0
+            self.posts_per_day = len(timestamps) / span_days if span_days > 0 else 0.0
+        elif self.last_check:
+            observed = new_count / max((now - self.last_check) / 86400, 1e-6)
+            self.posts_per_day = 0.7 * self.posts_per_day + 0.3 * observed
+        listed = [post.shortcode for post in posts]
+        self.seen = (listed + [shortcode for shortcode in self.seen if shortcode not in listed])[:SEEN_SHORTCODES]
+        if timestamps:
+            self.last_post_at = max(self.last_post_at, max(timestamps))
+        self.last_check = now
+        self.failures = 0
+
+
+class WatchList:
+    """
+    Thread-safe store of WatchedProfile objects, persisted as one JSON file.
+
+    Intervals: roughly TARGET_NEW_POSTS_PER_CHECK expected new posts between checks,
+    clamped to [min_interval, max_interval], and never shorter than the list size
+    allows within requests_per_hour (one request per check).
+    """
+
+    def __init__(self, path: Path, requests_per_hour: float, min_interval: float, max_interval: float):
+        self.path = path
+        self.requests_per_hour = requests_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.lock = threading.Lock()
+        self.profiles: Dict[str, WatchedProfile] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.profiles = {key: WatchedProfile.from_dict(entry) for key, entry in data.items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Watch list unreadable, starting empty: {e}")
+
+    def save(self) -> None:
+        """Persist the list (safe to call from a worker thread)"""
+        with self.lock:
+            data = {key: watched.to_dict() for key, watched in self.profiles.items()}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save watch list: {e}")
+
+    # ---- Subscriptions
+
+    def subscribe(self, username: str, chat_id: int, user_id: Optional[int]) -> bool:
+        """Add a chat to a profile's subscribers; False if it was already subscribed"""
+        with self.lock:
+            watched = self.profiles.get(username.lower())
+            if watched is None:
+                watched = self.profiles[username.lower()] = WatchedProfile(username)
+                watched.next_check = time.time()  # Baseline check right away
+            if str(chat_id) in watched.subscribers:
+                return False
+            watched.subscribers[str(chat_id)] = {'user_id': user_id, 'since': int(time.time())}
+            return True
+
+    def unsubscribe(self, username: str, chat_id: int) -> bool:
+        """Remove a chat from a profile; the profile is dropped once nobody watches it"""
+        with self.lock:
+            watched = self.profiles.get(username.lower())
+            if watched is None or watched.subscribers.pop(str(chat_id), None) is None:
+                return False
+            if not watched.subscribers:
+                del self.profiles[username.lower()]
+            return True
+
+    def drop(self, username: str) -> Optional[WatchedProfile]:
+        with self.lock:
+            return self.profiles.pop(username.lower(), None)
+
+    def for_chat(self, chat_id: int) -> List[WatchedProfile]:
+        with self.lock:
+            return [watched for watched in self.profiles.values() if str(chat_id) in watched.subscribers]
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+    # ---- Scheduling
+
+    def next_due(self, now: float) -> Optional[WatchedProfile]:
+        """The most overdue profile, or None if nothing is due yet"""
+        with self.lock:
+            if not self.profiles:
+                return None
+            watched = min(self.profiles.values(), key=lambda w: w.next_check)
+            return watched if watched.next_check <= now else None
+
+    def seconds_until_due(self, now: float) -> Optional[float]:
+        with self.lock:
+            if not self.profiles:
+                return None
+            return max(min(w.next_check for w in self.profiles.values()) - now, 0.0)
+
+    def budget_floor(self) -> float:
+        """Shortest interval that keeps every profile's checks within requests_per_hour"""
+        if self.requests_per_hour <= 0:
+            return self.min_interval
+        return len(self.profiles) * 3600 / self.requests_per_hour
+
+    def reschedule(self, watched: WatchedProfile, now: float, failed: bool = False) -> float:
+        """Pick the next check time after a check (or a failed one); returns the interval"""
+        if failed:
+            interval = max(watched.interval, self.min_interval) * 2
+        elif watched.posts_per_day:
+            interval = TARGET_NEW_POSTS_PER_CHECK * 86400 / watched.posts_per_day
+        else:
+            interval = self.max_interval  # Dormant
+        interval = min(max(interval, self.min_interval, self.budget_floor()), max(self.max_interval, self.budget_floor()))
+        with self.lock:
+            watched.interval = interval
+            interval *= random.uniform(1 - JITTER, 1 + JITTER)
+            watched.next_check = now + interval
+        return interval